@@ -5,11 +5,61 @@ from .query_utils import (
     query_trino,
     query_postgres,
     query_redshift,
+    iter_postgres_chunks,
+    iter_trino_chunks,
+    copy_postgres,
+    bulk_load,
+    query_with_vector,
+    query_prepared,
+)
+from .arrow_results import (
+    records_to_arrow,
+    arrow_to_pandas,
+)
+from .async_query import (
+    async_query_postgres,
+    gather_queries,
+    run_queries,
+)
+from .connection_pool import (
+    ConnectionPool,
+    get_pool,
+    close_all_pools,
+)
+from .result_cache import (
+    ResultCache,
+    get_result_cache,
+)
+from .partitioned_query import (
+    query_partitioned,
+)
+from .single_flight import (
+    SingleFlight,
+    query_stats,
 )
 
 __all__ = [
     "collapse_vector",
     "query_trino",
     "query_postgres",
-    "query_redshift"
+    "query_redshift",
+    "iter_postgres_chunks",
+    "iter_trino_chunks",
+    "copy_postgres",
+    "bulk_load",
+    "query_with_vector",
+    "query_prepared",
+    "records_to_arrow",
+    "arrow_to_pandas",
+    "async_query_postgres",
+    "gather_queries",
+    "run_queries",
+    "ConnectionPool",
+    "get_pool",
+    "close_all_pools",
+    "ResultCache",
+    "get_result_cache",
+    "query_partitioned",
+    "SingleFlight",
+    "query_stats"
 ]
\ No newline at end of file
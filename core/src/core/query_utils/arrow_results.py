@@ -0,0 +1,183 @@
+import re
+import logging
+import pandas as pd
+
+from typing import Optional, Sequence
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow is only needed for the arrow result formats
+    pa = None
+    pc = None
+
+
+logger = logging.getLogger(__name__)
+
+RESULT_FORMATS = ("pandas", "arrow", "arrow_pandas")
+
+# PostgreSQL / Redshift type OIDs reported in psycopg2 cursor.description
+_PSQL_OID_TYPES = {
+    16: "bool",
+    20: "int64",
+    21: "int16",
+    23: "int32",
+    700: "float32",
+    701: "float64",
+    1700: "decimal",
+    1082: "date",
+    1114: "timestamp",
+    1184: "timestamptz",
+    18: "string",
+    19: "string",
+    25: "string",
+    1042: "string",
+    1043: "string",
+    2950: "string",
+}
+
+# Trino type names reported in trino cursor.description (parameters stripped)
+_TRINO_TYPES = {
+    "boolean": "bool",
+    "tinyint": "int8",
+    "smallint": "int16",
+    "integer": "int32",
+    "bigint": "int64",
+    "real": "float32",
+    "double": "float64",
+    "decimal": "decimal",
+    "date": "date",
+    "timestamp": "timestamp",
+    "timestamp with time zone": "timestamptz",
+    "varchar": "string",
+    "char": "string",
+    "json": "string",
+    "uuid": "string",
+    "varbinary": "binary",
+}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("pyarrow is required for the 'arrow' and 'arrow_pandas' result formats.")
+
+
+def validate_result_format(result_format: str) -> None:
+    """
+    Raise early for unknown result formats, and for arrow formats when pyarrow is missing.
+    """
+    if result_format not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result_format '{result_format}'. Expected one of {RESULT_FORMATS}.")
+    if result_format != "pandas":
+        _require_pyarrow()
+
+
+def _arrow_type(kind: str, precision: Optional[int] = None, scale: Optional[int] = None):
+    if kind == "decimal":
+        if precision and 0 < precision <= 38:
+            return pa.decimal128(precision, scale or 0)
+        return None  # unconstrained numeric, let pyarrow infer from the values
+    return {
+        "bool": pa.bool_(),
+        "int8": pa.int8(),
+        "int16": pa.int16(),
+        "int32": pa.int32(),
+        "int64": pa.int64(),
+        "float32": pa.float32(),
+        "float64": pa.float64(),
+        "date": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+        "timestamptz": pa.timestamp("us", tz="UTC"),
+        "string": pa.string(),
+        "binary": pa.binary(),
+    }.get(kind)
+
+
+def column_type(column, backend: str):
+    """
+    Map one cursor.description entry to an Arrow type, or None when it should be inferred.
+    """
+    _require_pyarrow()
+
+    if backend == "trino":
+        type_name = str(column[1]).lower()
+        match = re.match(r"^(timestamp)\(\d+\) (with time zone)$", type_name)
+        base = f"{match.group(1)} {match.group(2)}" if match else type_name.split("(")[0].strip()
+        kind = _TRINO_TYPES.get(base)
+        if kind == "decimal":
+            params = re.findall(r"\d+", type_name)
+            precision, scale = (int(params[0]), int(params[1])) if len(params) == 2 else (None, None)
+            return _arrow_type(kind, precision, scale)
+        return _arrow_type(kind) if kind else None
+
+    kind = _PSQL_OID_TYPES.get(column[1])
+    if kind == "decimal":
+        return _arrow_type(kind, column[4], column[5])
+    return _arrow_type(kind) if kind else None
+
+
+def _column_array(values: Sequence, arrow_type):
+    """Build one Arrow array, falling back to inference and then to strings."""
+    if arrow_type is not None:
+        try:
+            return pa.array(values, type=arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            pass
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+
+def records_to_arrow(records: Sequence[tuple], description, backend: str) -> "pa.Table":
+    """
+    Build an Arrow table from fetched rows, one typed column at a time.
+
+    Column types come from the cursor description (type OIDs for
+    postgres/redshift, type names for trino), so timestamps and decimals
+    such as DECIMAL(34,2) keep their types instead of becoming object columns.
+    """
+    _require_pyarrow()
+
+    column_values = list(zip(*records)) if records else [()] * len(description)
+    arrays = []
+    fields = []
+
+    for column, values in zip(description, column_values):
+        array = _column_array(values, column_type(column, backend))
+        arrays.append(array)
+        fields.append(pa.field(column[0], array.type))
+
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def flatten_list_columns(table: "pa.Table") -> "pa.Table":
+    """
+    Join list columns into ', ' separated strings, mirroring query_postgres' pandas behaviour.
+    """
+    for index, field in enumerate(table.schema):
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            joined = pc.binary_join(pc.cast(table.column(index), pa.list_(pa.string())), ", ")
+            table = table.set_column(index, field.name, joined)
+    return table
+
+
+def arrow_to_pandas(table: "pa.Table") -> pd.DataFrame:
+    """
+    Convert an Arrow table to a DataFrame backed by Arrow dtypes (no copy to object columns).
+    """
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def build_result(records: Sequence[tuple], description, backend: str, result_format: str = "pandas"):
+    """
+    Materialize fetched rows in the requested result format.
+    """
+    if result_format == "pandas":
+        column_names = [desc[0] for desc in description]
+        return pd.DataFrame(records, columns=column_names)
+
+    table = records_to_arrow(records, description, backend)
+    if result_format == "arrow":
+        return table
+    return arrow_to_pandas(table)
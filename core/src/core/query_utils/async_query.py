@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import psycopg
+import pandas as pd
+
+from typing import List, Optional, Sequence, Tuple, Union
+from time import perf_counter
+from dotenv import load_dotenv
+
+from .connection_pool import _psql_credentials
+from .arrow_results import build_result, validate_result_format
+from .query_utils import CANCEL_GRACE_SECONDS, default_timeout, query_end
+
+
+logger = logging.getLogger(__name__)
+
+# Default number of queries allowed in flight at once by gather_queries
+DEFAULT_MAX_CONCURRENCY = 8
+
+QuerySpec = Union[str, Tuple[str, Optional[Union[dict, tuple, list]]]]
+
+
+async def async_connect(cred_prefix: str) -> psycopg.AsyncConnection:
+    """
+    Open a psycopg 3 AsyncConnection using the {cred_prefix}_* environment credentials.
+    """
+    load_dotenv()
+    return await psycopg.AsyncConnection.connect(**_psql_credentials(cred_prefix))
+
+
+async def async_query_postgres(query: str, cred_prefix: str, params = None,
+                               connection: Optional[psycopg.AsyncConnection] = None,
+                               semaphore: Optional[asyncio.Semaphore] = None,
+                               timeout: Optional[float] = None,
+                               result_format: str = "pandas") -> pd.DataFrame:
+    """
+    Run a read query on PostgreSQL with asyncio and return the result as a DataFrame.
+
+    Pass a connection to reuse one across calls (it must not be shared by
+    queries running at the same time), otherwise a connection is opened for
+    this call. An optional semaphore bounds how many queries are in flight.
+    timeout follows query_postgres: a server-side statement_timeout, with the
+    query cancelled on the server if the client gives up first.
+    """
+    validate_result_format(result_format)
+    timeout = default_timeout(timeout)
+
+    if semaphore is not None:
+        async with semaphore:
+            return await async_query_postgres(query, cred_prefix, params, connection, None, timeout, result_format)
+
+    start_time = perf_counter()
+    conn = connection or await async_connect(cred_prefix)
+
+    try:
+        async with conn.transaction(force_rollback=True):
+            async with conn.cursor() as cursor:
+                await cursor.execute(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+                logger.info(f"Running async query for DataFrame: {query}")
+
+                # psycopg sends a server-side cancel when the awaiting task is cancelled
+                execute = cursor.execute(query, params)
+                if timeout:
+                    await asyncio.wait_for(execute, timeout + CANCEL_GRACE_SECONDS)
+                else:
+                    await execute
+
+                records = await cursor.fetchall()
+                result = build_result(records, cursor.description, "postgres", result_format)
+
+    except psycopg.errors.QueryCanceled as e:
+        raise TimeoutError(f"Query execution exceeded {timeout} seconds and was cancelled.") from e
+
+    finally:
+        if connection is None:
+            await conn.close()
+
+    query_end(query, start_time)
+    return result
+
+
+async def gather_queries(queries: Sequence[QuerySpec], cred_prefix: str,
+                         max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                         timeout: Optional[float] = None, result_format: str = "pandas",
+                         return_exceptions: bool = False) -> List[pd.DataFrame]:
+    """
+    Run many read queries concurrently on one event loop and return their results in order.
+
+    Each entry is a query string or a (query, params) tuple. At most
+    max_concurrency queries run at once, and connections are reused between
+    queries, so no more than max_concurrency connections are opened. With
+    return_exceptions the exception for a failed query is returned in its
+    slot instead of being raised.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be a positive integer")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    idle_connections: List[psycopg.AsyncConnection] = []
+    open_connections: List[psycopg.AsyncConnection] = []
+
+    async def run(spec: QuerySpec) -> pd.DataFrame:
+        query, params = (spec, None) if isinstance(spec, str) else spec
+
+        async with semaphore:
+            if idle_connections:
+                conn = idle_connections.pop()
+            else:
+                conn = await async_connect(cred_prefix)
+                open_connections.append(conn)
+
+            try:
+                return await async_query_postgres(query, cred_prefix, params, connection=conn,
+                                                  timeout=timeout, result_format=result_format)
+            finally:
+                if not conn.closed:
+                    idle_connections.append(conn)
+
+    start_time = perf_counter()
+    try:
+        results = await asyncio.gather(*(run(spec) for spec in queries), return_exceptions=return_exceptions)
+    finally:
+        for conn in open_connections:
+            await conn.close()
+
+    logger.info(f"Ran {len(queries)} queries with up to {max_concurrency} in flight over {len(open_connections)} connections")
+    query_end("gather_queries", start_time)
+    return results
+
+
+def run_queries(queries: Sequence[QuerySpec], cred_prefix: str,
+                max_concurrency: int = DEFAULT_MAX_CONCURRENCY, **kwargs) -> List[pd.DataFrame]:
+    """
+    Synchronous wrapper around gather_queries for scripts without an event loop.
+    """
+    return asyncio.run(gather_queries(queries, cred_prefix, max_concurrency, **kwargs))
@@ -0,0 +1,346 @@
+import os
+import atexit
+import logging
+import threading
+import trino
+import psycopg2
+
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+from typing import Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing defaults, each can be overridden through the environment (.env)
+DEFAULT_MIN_SIZE = 0
+DEFAULT_MAX_SIZE = 8
+DEFAULT_MAX_IDLE_SECONDS = 300
+DEFAULT_PING_AFTER_SECONDS = 30
+DEFAULT_ACQUIRE_TIMEOUT_SECONDS = 120
+
+
+def _env_int(name: str, default: int) -> int:
+    """
+    Read an integer setting from the environment, falling back to the default.
+    """
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of database connections for a single backend/credential set.
+
+    Connections are opened lazily up to max_size, handed out LIFO so the
+    most recently used connection is reused first, health checked on checkout
+    and closed once they have sat idle longer than max_idle seconds (while
+    keeping at least min_size connections open).
+    """
+
+    def __init__(self, name: str, connect: Callable, check: Callable = None, reset: Callable = None,
+                 min_size: int = DEFAULT_MIN_SIZE, max_size: int = DEFAULT_MAX_SIZE,
+                 max_idle: float = DEFAULT_MAX_IDLE_SECONDS, ping_after: float = DEFAULT_PING_AFTER_SECONDS,
+                 acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT_SECONDS):
+        """
+        Initialize the pool.
+
+        Args:
+            name: Label used in log messages.
+            connect: Callable returning a new DB-API connection.
+            check: Callable(conn, ping) returning True if the connection is usable.
+            reset: Callable(conn) that returns a connection to a clean state on release.
+            min_size: Number of idle connections never evicted.
+            max_size: Maximum number of connections open at once.
+            max_idle: Seconds a connection may sit idle before it is closed.
+            ping_after: Seconds of idleness after which checkout runs a round trip check.
+            acquire_timeout: Seconds to wait for a free connection before raising TimeoutError.
+        """
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size for {name}: min={min_size}, max={max_size}")
+
+        self.name = name
+        self._connect = connect
+        self._check = check
+        self._reset = reset
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()  # (connection, last_used) pairs, most recent on the right
+        self._state = {}  # id(connection) -> per-connection session state
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+    @property
+    def size(self) -> int:
+        """Number of connections currently open (idle and checked out)."""
+        return len(self._idle) + self._in_use
+
+    def state(self, conn) -> dict:
+        """
+        Return a dict for session-level state tied to one pooled connection
+        (e.g. session settings already applied). It is dropped with the connection.
+        """
+        with self._cond:
+            return self._state.setdefault(id(conn), {})
+
+    def _close_quietly(self, conn) -> None:
+        with self._cond:
+            self._state.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled connection for {self.name}: {e}")
+
+    def _evict_idle(self, now: float) -> list:
+        """Pop connections idle past max_idle, oldest first. Caller holds the lock."""
+        evicted = []
+        while self._idle and self.size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            evicted.append(self._idle.popleft()[0])
+        return evicted
+
+    def acquire(self):
+        """
+        Check a connection out of the pool, opening a new one if none is idle.
+        """
+        deadline = monotonic() + self.acquire_timeout
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError(f"Connection pool {self.name} has been shut down.")
+
+                now = monotonic()
+                evicted = self._evict_idle(now)
+                candidate = None
+                open_new = False
+
+                if self._idle:
+                    candidate, last_used = self._idle.pop()
+                    self._in_use += 1
+                elif self.size < self.max_size:
+                    self._in_use += 1
+                    open_new = True
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"Timed out waiting for a connection from pool {self.name} (max_size={self.max_size})."
+                        )
+                    self._cond.wait(remaining)
+
+            for conn in evicted:
+                self._close_quietly(conn)
+
+            if open_new:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+                logger.info(f"Opened new connection for pool {self.name} ({self.size}/{self.max_size})")
+                return conn
+
+            if candidate is not None:
+                ping = now - last_used > self.ping_after
+                if self._check is None or self._is_healthy(candidate, ping):
+                    return candidate
+
+                logger.info(f"Discarding unhealthy connection from pool {self.name}")
+                self._discard(candidate)
+
+    def _is_healthy(self, conn, ping: bool) -> bool:
+        try:
+            return bool(self._check(conn, ping))
+        except Exception as e:
+            logger.warning(f"Health check failed for pool {self.name}: {e}")
+            return False
+
+    def _discard(self, conn) -> None:
+        self._close_quietly(conn)
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def release(self, conn, discard: bool = False) -> None:
+        """
+        Return a connection to the pool, or close it if discard is set or it cannot be reset.
+        """
+        if not discard and self._reset is not None:
+            try:
+                self._reset(conn)
+            except Exception as e:
+                logger.warning(f"Could not reset connection for pool {self.name}, discarding: {e}")
+                discard = True
+
+        if discard or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, monotonic()))
+            evicted = self._evict_idle(monotonic())
+            self._cond.notify()
+
+        for stale in evicted:
+            self._close_quietly(stale)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that checks a connection out and always returns it.
+        Connections that raised a driver-level connection error are discarded.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self) -> None:
+        """
+        Close every idle connection and refuse further checkouts.
+        Connections still checked out are closed when they are released.
+        """
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+
+        for conn in idle:
+            self._close_quietly(conn)
+
+        logger.info(f"Connection pool {self.name} shut down.")
+
+    def stats(self) -> Dict[str, int]:
+        """Return the current idle/in-use counts for observability."""
+        with self._cond:
+            return {"idle": len(self._idle), "in_use": self._in_use, "max_size": self.max_size}
+
+
+# Backend specific connection helpers
+def _psql_credentials(cred_prefix: str) -> dict:
+    return {
+        "host": os.getenv(f"{cred_prefix}_HOST"),
+        "port": int(os.getenv(f"{cred_prefix}_PORT", 8080)),  # Default port to 8080 if not set
+        "user": os.getenv(f"{cred_prefix}_USERNAME"),
+        "password": os.getenv(f"{cred_prefix}_PASSWORD"),
+        "dbname": os.getenv(f"{cred_prefix}_DATABASE"),
+    }
+
+
+def _psql_check(conn, ping: bool) -> bool:
+    if conn.closed:
+        return False
+    if ping:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+    return True
+
+
+def _psql_reset(conn) -> None:
+    if conn.closed:
+        raise psycopg2.InterfaceError("connection already closed")
+    # End any read transaction left open so pooled connections never sit idle in transaction
+    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+
+
+def _trino_connect(schema: Optional[str]):
+    host = os.getenv("TRINO_HOST")
+    port = int(os.getenv("TRINO_PORT", 8080))  # Default port to 8080 if not set
+    user = os.getenv("TRINO_USERNAME")
+    password = os.getenv("TRINO_PASSWORD")
+    catalog = os.getenv("TRINO_CATALOG")
+
+    return trino.dbapi.connect(
+        host=host,
+        port=port,
+        user=user,
+        catalog=catalog,
+        schema=schema,
+        http_scheme="https" if password else "http",
+        auth=trino.auth.BasicAuthentication(user, password) if password else None,
+    )
+
+
+def _connection_factory(backend: str, cred_prefix: str, schema: Optional[str]) -> Tuple[Callable, Callable, Callable]:
+    """Return the (connect, check, reset) callables for a backend."""
+    if backend in ("postgres", "redshift"):
+        credentials = _psql_credentials(cred_prefix)
+        return (lambda: psycopg2.connect(**credentials)), _psql_check, _psql_reset
+
+    if backend == "trino":
+        # Trino connections are HTTP sessions; reuse keeps the keep-alive/TLS session warm
+        return (lambda: _trino_connect(schema)), None, None
+
+    raise ValueError(f"Unsupported backend '{backend}'. Expected postgres, redshift or trino.")
+
+
+# Process-wide pool registry
+_pools: Dict[Tuple[str, str, Optional[str]], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(backend: str, cred_prefix: str, schema: Optional[str] = None) -> ConnectionPool:
+    """
+    Return the shared pool for a backend and credential prefix, creating it on first use.
+
+    Pool sizing is read from QUERY_POOL_MIN_SIZE, QUERY_POOL_MAX_SIZE,
+    QUERY_POOL_MAX_IDLE_SECONDS and QUERY_POOL_PING_AFTER_SECONDS.
+    """
+    key = (backend, cred_prefix, schema)
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            load_dotenv()
+            connect, check, reset = _connection_factory(backend, cred_prefix, schema)
+            label = f"{backend}:{cred_prefix}" + (f":{schema}" if schema else "")
+            pool = ConnectionPool(
+                label,
+                connect,
+                check=check,
+                reset=reset,
+                min_size=_env_int("QUERY_POOL_MIN_SIZE", DEFAULT_MIN_SIZE),
+                max_size=_env_int("QUERY_POOL_MAX_SIZE", DEFAULT_MAX_SIZE),
+                max_idle=_env_int("QUERY_POOL_MAX_IDLE_SECONDS", DEFAULT_MAX_IDLE_SECONDS),
+                ping_after=_env_int("QUERY_POOL_PING_AFTER_SECONDS", DEFAULT_PING_AFTER_SECONDS),
+                acquire_timeout=_env_int("QUERY_POOL_ACQUIRE_TIMEOUT_SECONDS", DEFAULT_ACQUIRE_TIMEOUT_SECONDS),
+            )
+            _pools[key] = pool
+
+    return pool
+
+
+def close_all_pools() -> None:
+    """
+    Shut down every pool in the registry. Registered with atexit, but can be
+    called explicitly at the end of a run (or before forking workers).
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all_pools)
@@ -0,0 +1,184 @@
+import datetime
+import decimal
+import logging
+import pandas as pd
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+from time import perf_counter
+
+from .arrow_results import validate_result_format
+from .connection_pool import get_pool
+from .query_utils import query_end, query_postgres, query_redshift, query_trino
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is only needed for the arrow result formats
+    pa = None
+
+
+logger = logging.getLogger(__name__)
+
+PARTITION_STRATEGIES = ("range", "hash")
+
+# Per-backend expression mapping a column to a bucket in [0, n); NULLs hash to NULL and go to bucket 0
+_HASH_BUCKET = {
+    "postgres": "abs(mod(hashtext(({column})::text), {n}))",
+    "redshift": "mod(strtol(left(md5(({column})::varchar), 8), 16), {n})",
+    "trino": "abs(mod(from_big_endian_64(xxhash64(to_utf8(cast({column} AS varchar)))), {n}))",
+}
+
+
+def _sql_literal(value) -> str:
+    """Render a partition boundary as a SQL literal understood by postgres, redshift and trino."""
+    if isinstance(value, datetime.datetime):
+        return f"TIMESTAMP '{value.replace(tzinfo=None).isoformat(sep=' ')}'"
+    if isinstance(value, datetime.date):
+        return f"DATE '{value.isoformat()}'"
+    return str(value)
+
+
+def _python_value(value):
+    """Unwrap numpy/pandas scalars returned by the bounds query."""
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item") and not isinstance(value, (datetime.date, decimal.Decimal)):
+        return value.item()
+    if isinstance(value, decimal.Decimal) and value == value.to_integral_value():
+        return int(value)
+    return value
+
+
+def range_boundaries(low, high, n_partitions: int) -> List:
+    """
+    Split [low, high] into n_partitions contiguous ranges and return the n_partitions + 1 edges.
+    Works for integers, floats/decimals, dates and timestamps.
+    """
+    if isinstance(low, bool) or not isinstance(low, (int, float, decimal.Decimal, datetime.date)):
+        raise TypeError(f"Range partitioning needs a numeric or date/time column, got {type(low).__name__}. Use strategy='hash'.")
+
+    if isinstance(low, int):
+        edges = [low + (high - low) * index // n_partitions for index in range(n_partitions)]
+    else:
+        edges = [low + (high - low) * index / n_partitions for index in range(n_partitions)]
+    return edges + [high]
+
+
+def partition_filters(partition_column: str, n_partitions: int, strategy: str, backend: str,
+                      bounds: Optional[Tuple] = None) -> List[str]:
+    """
+    Build one WHERE predicate per partition. Together they cover every row exactly once;
+    rows where the column is NULL belong to the first partition.
+    """
+    if strategy == "hash":
+        bucket = _HASH_BUCKET[backend].format(column=partition_column, n=n_partitions)
+        filters = [f"{bucket} = {index}" for index in range(n_partitions)]
+    else:
+        edges = range_boundaries(bounds[0], bounds[1], n_partitions)
+        filters = []
+        for index in range(n_partitions):
+            upper = "<=" if index == n_partitions - 1 else "<"
+            filters.append(
+                f"{partition_column} >= {_sql_literal(edges[index])} AND {partition_column} {upper} {_sql_literal(edges[index + 1])}"
+            )
+
+    filters[0] = f"(({filters[0]}) OR {partition_column} IS NULL)"
+    return filters
+
+
+def query_partitioned(query_template: str, partition_column: str, n_partitions: int, backend: str,
+                      cred_prefix: Optional[str] = None, schema: Optional[str] = None, catalog: Optional[str] = None,
+                      strategy: str = "range", bounds: Optional[Tuple] = None, stream: bool = False,
+                      max_workers: Optional[int] = None, result_format: str = "pandas",
+                      timeout: Optional[float] = None):
+    """
+    Run one large read as n_partitions sub-queries in parallel over pooled connections.
+
+    query_template marks where the partition predicate goes with
+    {partition_filter}, e.g. "SELECT * FROM rates WHERE {partition_filter} AND
+    billing_code_type = 'CPT'". With strategy="range" the column's MIN/MAX are
+    looked up first (pass bounds=(low, high) to skip that query) and split into
+    equal ranges; strategy="hash" buckets any column type by a hash of its
+    value, which also balances skewed ranges. backend is "postgres" (needs
+    cred_prefix), "redshift" or "trino" (needs schema and catalog).
+
+    Results are concatenated in partition order, or with stream=True yielded
+    one partition at a time, in order, as they finish. Each sub-query holds a
+    pooled connection, so max_workers (default n_partitions) is capped at the
+    pool's max_size (QUERY_POOL_MAX_SIZE); further partitions wait for a free
+    worker rather than for a connection, so they never hit the pool's acquire timeout.
+    """
+    if n_partitions < 1:
+        raise ValueError("n_partitions must be a positive integer")
+    if strategy not in PARTITION_STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}'. Expected one of {PARTITION_STRATEGIES}.")
+    if backend not in _HASH_BUCKET:
+        raise ValueError(f"Unsupported backend '{backend}'. Expected postgres, redshift or trino.")
+    if backend == "postgres" and not cred_prefix:
+        raise ValueError("cred_prefix is required for the postgres backend")
+    validate_result_format(result_format)
+
+    def run(sql: str, run_format: str, cache=None):
+        if backend == "postgres":
+            result = query_postgres(sql, False, cred_prefix, result_format=run_format, timeout=timeout, cache=cache)
+        elif backend == "redshift":
+            result = query_redshift(sql, False, result_format=run_format, timeout=timeout, cache=cache)
+        else:
+            result = query_trino(schema, catalog, sql, False, result_format=run_format, timeout=timeout, cache=cache)
+        if result is None:
+            raise RuntimeError(f"Partition query returned no result: {sql}")
+        return result
+
+    if strategy == "range" and bounds is None:
+        unfiltered = query_template.replace("{partition_filter}", "1 = 1").strip().rstrip(";")
+        bounds_df = run(
+            f"SELECT MIN({partition_column}) AS low, MAX({partition_column}) AS high FROM ({unfiltered}) AS partition_bounds",
+            "pandas",
+            cache=False,
+        )
+        bounds = (_python_value(bounds_df.iloc[0, 0]), _python_value(bounds_df.iloc[0, 1]))
+        logger.info(f"Partitioning {partition_column} over {bounds[0]} .. {bounds[1]}")
+
+    if strategy == "range" and bounds[0] is None:
+        # Empty table (or only NULLs): a single query returns the result with its columns
+        filters = [f"({partition_column} IS NULL OR {partition_column} IS NOT NULL)"]
+    else:
+        filters = partition_filters(partition_column, n_partitions, strategy, backend, bounds)
+    queries = [query_template.replace("{partition_filter}", partition_filter) for partition_filter in filters]
+
+    if backend == "postgres":
+        pool = get_pool("postgres", cred_prefix)
+    elif backend == "redshift":
+        pool = get_pool("redshift", "REDSHIFT")
+    else:
+        pool = get_pool("trino", "TRINO", schema=schema)
+    max_workers = min(max_workers or len(queries), len(queries), pool.max_size)
+
+    start_time = perf_counter()
+    results = _run_partitions(queries, run, result_format, max_workers)
+    if stream:
+        return results
+
+    parts = list(results)
+    query_end(f"query_partitioned ({len(parts)} partitions)", start_time)
+    if result_format == "arrow":
+        return pa.concat_tables(parts)
+    return pd.concat(parts, ignore_index=True)
+
+
+def _run_partitions(queries: List[str], run, result_format: str, max_workers: int) -> Iterator:
+    """Submit every partition query now and return an iterator over the results in partition order."""
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="partition")
+    futures = [executor.submit(run, query, result_format) for query in queries]
+    return _ordered_results(executor, futures)
+
+
+def _ordered_results(executor: ThreadPoolExecutor, futures: List[Future]) -> Iterator:
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        # Partitions not started yet are dropped if the caller stops early or one fails
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
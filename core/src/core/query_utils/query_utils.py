@@ -1,25 +1,52 @@
 import trino
 import psycopg2
+import psycopg2.errors
+import psycopg2.extras
 import psycopg
 import pandas as pd
+import io
+import itertools
 import os
+import re
+import csv
+import decimal
+import hashlib
 import logging
 import warnings
 import threading
 
-from typing import List
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from contextlib import contextmanager
+from uuid import uuid4
 from time import perf_counter
-from dotenv import load_dotenv
+
+from .connection_pool import get_pool
+from .arrow_results import _PSQL_OID_TYPES, arrow_to_pandas, build_result, column_type as arrow_column_type, flatten_list_columns, validate_result_format
+from .result_cache import _SQL_LITERAL, ResultCache
+from .single_flight import shared_result
 
 
 # Configure logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Default number of rows per DataFrame yielded by the streaming readers
+DEFAULT_CHUNK_ROWS = 50000
+
+# Default server-side timeout for Postgres reads, overridable with QUERY_TIMEOUT_SECONDS
+DEFAULT_QUERY_TIMEOUT_SECONDS = 600
+# Extra time given to the server to honour its own timeout before the client cancels
+CANCEL_GRACE_SECONDS = 30
+
+# Rows per COPY batch for bulk_load on Postgres, and per multi-row INSERT on Redshift (kept well under its 16 MB statement limit)
+DEFAULT_COPY_BATCH_ROWS = 50000
+DEFAULT_INSERT_BATCH_ROWS = 1000
+
 # Helper Functions
 def collapse_vector(vector_to_collapse: List[str]) -> str:
     """
     Convert a list of strings into a single string formatted for SQL queries.
+    For long lists prefer query_with_vector, which COPYs the values into a temp table instead of pasting them into the SQL.
     """
     string_value = "', '".join(vector_to_collapse)
     return f"'{string_value}'"
@@ -35,7 +62,72 @@ def query_end(query_name: str, start_time: float) -> None:
     logger.info(f"Duration: {end_time - start_time} seconds")
 
 
-def execute_sql(conn: trino.dbapi.Connection, sql: str) -> None:
+def default_timeout(timeout: Optional[float]) -> float:
+    """
+    Resolve a per-call timeout: None means QUERY_TIMEOUT_SECONDS (default 10 minutes), 0 means no limit.
+    """
+    if timeout is None:
+        timeout = float(os.getenv("QUERY_TIMEOUT_SECONDS", DEFAULT_QUERY_TIMEOUT_SECONDS))
+    return timeout
+
+
+def set_statement_timeout(cursor, timeout: Optional[float]) -> None:
+    """
+    Apply a server-side statement_timeout for the current transaction only (Postgres and Redshift).
+    The setting is discarded when the pooled connection is committed or rolled back.
+    """
+    if timeout is None:
+        return
+    cursor.execute(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+
+
+def set_trino_timeout(conn: trino.dbapi.Connection, state: dict, timeout: Optional[float]) -> None:
+    """
+    Apply the query_max_run_time session property to a pooled Trino connection.
+    The value is tracked in the pool's connection state so SET SESSION only runs when it changes.
+    """
+    value = f"{int(timeout)}s" if timeout else None
+    if state.get("query_max_run_time") == value:
+        return
+
+    cursor = conn.cursor()
+    if value:
+        cursor.execute(f"SET SESSION query_max_run_time = '{value}'")
+    else:
+        cursor.execute("RESET SESSION query_max_run_time")
+    cursor.fetchall()
+    state["query_max_run_time"] = value
+
+
+@contextmanager
+def cancel_after(cancel: Callable[[], None], timeout: Optional[float]):
+    """
+    Call cancel() from a timer thread if the block is still running after
+    timeout plus a grace period. This is a backstop for the server-side
+    timeout (e.g. when the server stops responding); cancel() asks the server
+    to stop the query so it does not keep running after the client gives up.
+    """
+    if not timeout:
+        yield
+        return
+
+    def fire():
+        logger.warning(f"Query still running after {timeout} seconds. Cancelling it on the server.")
+        try:
+            cancel()
+        except Exception as e:
+            logger.warning(f"Error cancelling query: {e}")
+
+    timer = threading.Timer(timeout + CANCEL_GRACE_SECONDS, fire)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    finally:
+        timer.cancel()
+
+
+def execute_sql(conn: trino.dbapi.Connection, sql: str, timeout: Optional[float] = None) -> None:
     """
     Execute a SQL statement (non-SELECT) using a Trino connection.
     """
@@ -44,7 +136,8 @@ def execute_sql(conn: trino.dbapi.Connection, sql: str) -> None:
             warnings.simplefilter("ignore")
             logger.info(f"Running statement: {sql}")
             cursor = conn.cursor()
-            cursor.execute(sql)
+            with cancel_after(cursor.cancel, timeout):
+                cursor.execute(sql)
         except trino.exceptions.HttpError as e:
             if "io.trino.NotInTransactionException" in str(e):
                 logger.info(
@@ -53,157 +146,213 @@ def execute_sql(conn: trino.dbapi.Connection, sql: str) -> None:
             else:
                 raise e
 
-def pd_execute_sql(conn: trino.dbapi.Connection, sql: str) -> pd.DataFrame:
+def pd_execute_sql(conn: trino.dbapi.Connection, sql: str, result_format: str = "pandas",
+                   timeout: Optional[float] = None) -> pd.DataFrame:
     """
-    Execute a SQL query and return the result as a Pandas DataFrame.
+    Execute a SQL query and return the result as a Pandas DataFrame (or Arrow, see result_format).
     """
     try: 
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             logger.info(f"Running query for DataFrame: {sql}")
             cursor = conn.cursor()
-            cursor.execute(sql)
-            records = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            return pd.DataFrame(records, columns=column_names)
+            with cancel_after(cursor.cancel, timeout):
+                cursor.execute(sql)
+                records = cursor.fetchall()
+            return build_result(records, cursor.description, "trino", result_format)
         
     except Exception as e: 
         logger.warning(f"Error finding customer data: {e}")
             
 
 
-def query_trino(schema: str, catalog: str, query: str, db_change: bool) -> pd.DataFrame:
+def query_trino(schema: str, catalog: str, query: str, db_change: bool, result_format: str = "pandas",
+                timeout: Optional[float] = None, cache: Union[None, bool, ResultCache] = None) -> pd.DataFrame:
     """
-    Run a query on a Trino database using a direct connection.
+    Run a query on a Trino database using a pooled connection.
+    result_format is "pandas" (default), "arrow" for a pyarrow Table or "arrow_pandas" for an Arrow-backed DataFrame.
+    timeout (seconds) sets the query_max_run_time session property and cancels the query client side as a backstop.
+    Identical concurrent reads share one execution, and reads go through the result cache
+    when QUERY_CACHE_DIR is set; cache=False bypasses both.
     """
-    load_dotenv()
-    host = os.getenv("TRINO_HOST")
-    port = int(os.getenv("TRINO_PORT", 8080))  # Default port to 8080 if not set
-    user = os.getenv("TRINO_USERNAME")
-    password = os.getenv("TRINO_PASSWORD")
-    catalog = os.getenv("TRINO_CATALOG")
-
+    validate_result_format(result_format)
     start_time = perf_counter()
 
-    # Establish connection
-    conn = trino.dbapi.connect(
-        host=host,
-        port=port,
-        user=user,
-        catalog=catalog,
-        schema=schema,
-        http_scheme="https" if password else "http",
-        auth=trino.auth.BasicAuthentication(user, password) if password else None,
-    )
+    if not db_change and cache is not False:
+        return shared_result(cache, f"trino:{catalog}:{schema}", query, None, result_format,
+                             lambda: query_trino(schema, catalog, query, False, result_format, timeout, cache=False))
 
-    if db_change:
-        execute_sql(conn, query)
-    else:
-        result_df = pd_execute_sql(conn, query)
-        query_end(query, start_time)
+    pool = get_pool("trino", "TRINO", schema=schema)
+    with pool.connection() as conn:
+        set_trino_timeout(conn, pool.state(conn), timeout)
 
-        return result_df
+        if db_change:
+            execute_sql(conn, query, timeout)
+        else:
+            result_df = pd_execute_sql(conn, query, result_format, timeout)
+            query_end(query, start_time)
+
+            return result_df
 
     query_end(query, start_time)
 
 
-def query_redshift(query, db_change, columns = None):
-    load_dotenv()
+def iter_trino_chunks(schema: str, catalog: str, query: str, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                      result_format: str = "pandas", timeout: Optional[float] = None) -> Iterator:
+    """
+    Stream a Trino query as typed batches of at most chunk_rows rows.
+
+    Rows are pulled from the coordinator page by page with fetchmany, so only
+    one batch (plus the page being read) is held client side and the caller
+    can start processing before the query finishes. Each batch is built with
+    the column types from the cursor description, in the requested
+    result_format. If the query returns no rows a single empty batch with the
+    result columns is yielded. Closing the generator early cancels the query
+    on the coordinator. The pooled connection stays checked out until the
+    generator is exhausted or closed.
+    """
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows must be a positive integer")
+    validate_result_format(result_format)
 
     start_time = perf_counter()
+    total_rows = 0
+    finished = False
 
-    host = os.getenv("REDSHIFT_HOST")
-    port = int(os.getenv("REDSHIFT_PORT", 8080))  # Default port to 8080 if not set
-    user = os.getenv("REDSHIFT_USERNAME")
-    password = os.getenv("REDSHIFT_PASSWORD")
-    catalog = os.getenv("REDSHIFT_DATABASE")
-        
-    try:
-        conn = psycopg2.connect(
-            dbname=catalog,
-            user=user,
-            password=password,
-            host=host,
-            port=port
-        )
+    pool = get_pool("trino", "TRINO", schema=schema)
+    with pool.connection() as conn:
+        set_trino_timeout(conn, pool.state(conn), timeout)
         cursor = conn.cursor()
 
-        if not db_change:
+        try:
+            logger.info(f"Streaming Trino query in chunks of {chunk_rows} rows: {query}")
             cursor.execute(query)
-            query_result = cursor.fetchall()
 
-            if columns:
-                query_result = pd.DataFrame(query_result, columns=columns)
+            while True:
+                with cancel_after(cursor.cancel, timeout):
+                    records = cursor.fetchmany(chunk_rows)
+
+                if not records:
+                    if total_rows == 0:
+                        yield build_result(records, cursor.description, "trino", result_format)
+                    finished = True
+                    break
+
+                total_rows += len(records)
+                yield build_result(records, cursor.description, "trino", result_format)
+
+        finally:
+            if not finished:
+                # Stop the query on the coordinator when the caller stops reading early
+                try:
+                    cursor.cancel()
+                except Exception as e:
+                    logger.warning(f"Error cancelling Trino query: {e}")
+
+    logger.info(f"Streamed {total_rows} rows")
+    query_end(query, start_time)
+
+
+def query_redshift(query, db_change, columns = None, result_format: str = "pandas", timeout: Optional[float] = None,
+                   cache: Union[None, bool, ResultCache] = None):
+    """
+    Run a query on Redshift using a pooled connection.
+    result_format is "pandas" (default), "arrow" for a pyarrow Table or "arrow_pandas" for an Arrow-backed DataFrame.
+    timeout (seconds) sets statement_timeout for the call; by default Redshift statements are not limited.
+    Identical concurrent reads share one execution, and reads go through the result cache
+    when QUERY_CACHE_DIR is set; cache=False bypasses both.
+    """
+    validate_result_format(result_format)
+    start_time = perf_counter()
+
+    if not db_change and cache is not False:
+        return shared_result(cache, "redshift:REDSHIFT", query, columns, result_format,
+                             lambda: query_redshift(query, False, columns, result_format, timeout, cache=False))
+
+    try:
+        with get_pool("redshift", "REDSHIFT").connection() as conn:
+            with conn.cursor() as cursor:
+                set_statement_timeout(cursor, timeout)
+
+                if not db_change:
+                    with cancel_after(conn.cancel, timeout):
+                        cursor.execute(query)
+                    query_result = cursor.fetchall()
+
+                    if result_format != "pandas":
+                        query_result = build_result(query_result, cursor.description, "redshift", "arrow")
+                        if columns:
+                            query_result = query_result.rename_columns(columns)
+                        return query_result if result_format == "arrow" else arrow_to_pandas(query_result)
+
+                    if columns:
+                        query_result = pd.DataFrame(query_result, columns=columns)
+
+                    else:
+                        columns = [desc[0] for desc in cursor.description]
+                        query_result = pd.DataFrame(query_result, columns=columns)
+
+                    return query_result
+
+                else:
+                    with cancel_after(conn.cancel, timeout):
+                        cursor.execute(query)
+                    conn.commit()
 
-            else:
-                columns = [desc[0] for desc in cursor.description]
-                query_result = pd.DataFrame(query_result, columns=columns)
-            
-            return query_result
-            
-        else: 
-            cursor.execute(query)
-            conn.commit()
-        
         query_end(' ', start_time)
 
+    except psycopg2.errors.QueryCanceled as e:
+        logger.warning(f"Redshift query exceeded {timeout} seconds and was cancelled.")
+        raise TimeoutError(f"Query execution exceeded {timeout} seconds and was cancelled.") from e
+
     except Exception as e:
         logger.warning(f"Error executing query: {e}")
         raise
-    
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'cursor' in locals():
-            conn.close()
 
 
-def pd_execute_psql(conn: psycopg2.extensions.connection, sql: str, params=None) -> pd.DataFrame:
+def pd_execute_psql(conn: psycopg2.extensions.connection, sql: str, params=None, result_format: str = "pandas",
+                    timeout: Optional[float] = None) -> pd.DataFrame:
     """
     Execute a PostgreSQL query and return the result as a pandas DataFrame.
-    If the query takes longer than 10 minutes, the cursor is closed.
+    The query runs under a server-side statement_timeout (timeout seconds, default
+    10 minutes via QUERY_TIMEOUT_SECONDS, 0 for no limit) and is cancelled on the
+    server with conn.cancel() if it still has not returned after a grace period.
     Includes error handling for missing results, empty parameters, and timeout.
     """
+    timeout = default_timeout(timeout)
+
     try:
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             logger.info(f"Running query for DataFrame: {sql}")
             cursor = conn.cursor()
 
-            # Function to execute the query
-            def execute_query():
-                try:
+            if isinstance(params, list) and len(params) == 0:
+                logger.error("Params list is empty. Cannot execute query.")
+                raise ValueError("Params list cannot be empty")
+
+            set_statement_timeout(cursor, timeout)
+
+            try:
+                with cancel_after(conn.cancel, timeout):
                     if params is None:
                         logger.info("Executing query without parameters.")
                         cursor.execute(sql)
-                    elif isinstance(params, list) and len(params) == 0:
-                        logger.error("Params list is empty. Cannot execute query.")
-                        raise ValueError("Params list cannot be empty")
                     else:
                         logger.info(f"Executing query with params: {params}")
                         cursor.execute(sql, params)
-                except psycopg2.Error as e:
-                    logger.error(f"Database error: {e}")
-                    raise
-
-            # Start the query execution in a thread
-            query_thread = threading.Thread(target=execute_query)
-            query_thread.start()
-            query_thread.join(timeout=600)  # Wait for up to 10 minutes
+            except psycopg2.errors.QueryCanceled as e:
+                logger.warning(f"Query exceeded {timeout} seconds and was cancelled on the server.")
+                raise TimeoutError(f"Query execution exceeded {timeout} seconds and was cancelled.") from e
 
-            if query_thread.is_alive():
-                logger.warning("Query took too long to complete. Closing cursor.")
-                cursor.close()
-                raise TimeoutError("Query execution exceeded 10 minutes and was terminated.")
-
-            # Fetch results if the query completed within the timeout
             records = cursor.fetchall()
             if not records:  # Handle no results case
                 logger.warning("Query executed successfully but returned no results.")
+                if result_format != "pandas":
+                    return build_result(records, cursor.description, "postgres", result_format)
                 return pd.DataFrame()
 
-            column_names = [desc[0] for desc in cursor.description]
-            return pd.DataFrame(records, columns=column_names)
+            return build_result(records, cursor.description, "postgres", result_format)
 
     except psycopg2.Error as db_error:
         logger.error(f"Database error occurred: {db_error}")
@@ -218,54 +367,503 @@ def pd_execute_psql(conn: psycopg2.extensions.connection, sql: str, params=None)
             logger.warning(f"Error closing cursor: {e}")
 
 
-def query_postgres(query: str, db_change: bool, cred_prefix: str, params = None) -> pd.DataFrame:
+# NULL marker for COPY output parsed in memory, so NULL, '' and the string 'NA' stay distinct
+COPY_NULL_MARKER = "\\N"
+
+
+def _convert_copy_column(values: pd.Series, kind: Optional[str]) -> pd.Series:
+    """Convert one column of COPY text to the type the cursor path would return for its type OID."""
+    if kind == "bool":
+        return values.map({"t": True, "f": False})
+    if kind in ("int16", "int32", "int64", "float32", "float64"):
+        return pd.to_numeric(values)
+    if kind == "decimal":
+        return values.map(decimal.Decimal, na_action="ignore")
+    if kind == "date":
+        return pd.to_datetime(values).dt.date
+    if kind == "timestamp":
+        return pd.to_datetime(values)
+    if kind == "timestamptz":
+        return pd.to_datetime(values, utc=True)
+    return values
+
+
+def _parse_copy_csv(buffer: io.BytesIO, description, header: bool, result_format: str):
     """
-    Run on a postgresql database using direct connection
+    Parse COPY CSV output held in memory into the requested result format.
+    Nothing is inferred from the text: column types come from the query's cursor
+    description, and only the COPY_NULL_MARKER is read as NULL, so values such as
+    NPIs with leading zeros, '' and 'NA' come back exactly as the cursor path returns them.
     """
-    load_dotenv()
-    
-    host = os.getenv(f"{cred_prefix}_HOST")
-    port = int(os.getenv(f"{cred_prefix}_PORT", 8080))  # Default port to 8080 if not set
-    user = os.getenv(f"{cred_prefix}_USERNAME")
-    password = os.getenv(f"{cred_prefix}_PASSWORD")
-    catalog = os.getenv(f"{cred_prefix}_DATABASE")
-  
+    column_names = [desc[0] for desc in description]
+
+    if result_format == "pandas":
+        if not buffer.getbuffer().nbytes:
+            return pd.DataFrame(columns=column_names)
+        df = pd.read_csv(buffer, names=column_names, header=0 if header else None, dtype=str,
+                         keep_default_na=False, na_values=[COPY_NULL_MARKER])
+        for desc in description:
+            df[desc[0]] = _convert_copy_column(df[desc[0]], _PSQL_OID_TYPES.get(desc[1]))
+        return df
+
+    import pyarrow as pa
+    import pyarrow.csv
+
+    # Types without an Arrow mapping (json, uuid, unconstrained numeric, ...) stay text rather than being guessed
+    column_types = {desc[0]: arrow_column_type(desc, "postgres") or pa.string() for desc in description}
+    table = pyarrow.csv.read_csv(
+        buffer,
+        read_options=pyarrow.csv.ReadOptions(column_names=column_names, skip_rows=1 if header else 0),
+        convert_options=pyarrow.csv.ConvertOptions(
+            column_types=column_types, null_values=[COPY_NULL_MARKER], strings_can_be_null=True,
+            quoted_strings_can_be_null=False, true_values=["t"], false_values=["f"],
+        ),
+    )
+    return table if result_format == "arrow" else arrow_to_pandas(table)
+
+
+def copy_postgres(query: str, cred_prefix: str, destination: Union[str, os.PathLike, BinaryIO, None] = None,
+                  binary: bool = False, header: bool = True, params = None,
+                  result_format: str = "pandas", timeout: Optional[float] = None) -> Union[pd.DataFrame, int]:
+    """
+    Run a query through COPY (query) TO STDOUT and stream the raw output.
+
+    The bytes go straight from the server into destination, which may be a
+    file path or a writable file object, without building a Python object
+    per row. With no destination the CSV output is parsed into a DataFrame
+    (or, for the arrow result formats, by pyarrow's multithreaded CSV reader),
+    typed from the query's column types so it matches query_postgres' cursor path.
+    Binary format requires a destination. timeout behaves as in pd_execute_psql.
+    When writing to a destination the number of rows copied is returned.
+    """
+    validate_result_format(result_format)
+    timeout = default_timeout(timeout)
+    if binary and destination is None:
+        raise ValueError("Binary COPY output needs a file path or file object destination")
+
     start_time = perf_counter()
+    copy_format = "binary" if binary else "csv"
+    copy_options = f"FORMAT {copy_format}" + (", HEADER" if header and not binary else "")
+    if destination is None:
+        copy_options += f", NULL '{COPY_NULL_MARKER}'"
+
+    with get_pool("postgres", cred_prefix).connection() as conn:
+        with conn.cursor() as cursor:
+            # COPY does not accept bind parameters, so inline them with the driver's quoting
+            if params:
+                query = cursor.mogrify(query, params).decode(psycopg2.extensions.encodings[conn.encoding])
+
+            statement = f"COPY ({query.strip().rstrip(';')}) TO STDOUT WITH ({copy_options})"
+            logger.info(f"Running COPY export: {statement}")
+            set_statement_timeout(cursor, timeout)
+
+            with cancel_after(conn.cancel, timeout):
+                if destination is None:
+                    # COPY output carries no types, so read them from a zero-row run of the same query
+                    cursor.execute(f"SELECT * FROM ({query.strip().rstrip(';')}) AS copy_columns LIMIT 0")
+                    description = cursor.description
+                    buffer = io.BytesIO()
+                    cursor.copy_expert(statement, buffer)
+                    buffer.seek(0)
+                    result_df = _parse_copy_csv(buffer, description, header, result_format)
+
+                elif isinstance(destination, (str, os.PathLike)):
+                    with open(destination, "wb") as file:
+                        cursor.copy_expert(statement, file)
+
+                else:
+                    cursor.copy_expert(statement, destination)
+
+            row_count = cursor.rowcount
 
-    conn = psycopg2.connect(
-        dbname=catalog,
-        user=user,
-        password=password,
-        host=host,
-        port=port
-    )
+    query_end(query, start_time)
+
+    if destination is None:
+        return result_df
+    return row_count
+
+
+def query_postgres(query: str, db_change: bool, cred_prefix: str, params = None, use_copy: bool = False,
+                   result_format: str = "pandas", timeout: Optional[float] = None,
+                   cache: Union[None, bool, ResultCache] = None) -> pd.DataFrame:
+    """
+    Run on a postgresql database using a pooled connection.
+    With use_copy the result is fetched through COPY TO STDOUT as CSV rather than row by row.
+    result_format is "pandas" (default), "arrow" for a pyarrow Table or "arrow_pandas" for an Arrow-backed DataFrame.
+    timeout is in seconds (None for QUERY_TIMEOUT_SECONDS / 10 minutes, 0 for no limit).
+    Identical concurrent reads share one execution (see single_flight) and results are cached
+    on disk when QUERY_CACHE_DIR is set (see result_cache); cache=False bypasses both.
+    """
+    validate_result_format(result_format)
+    start_time = perf_counter()
 
     if db_change:
         print("Cannot write to db at this time")
+        query_end(query, start_time)
+        return
 
-    else:
-        if not params: 
-            result_df = pd_execute_psql(conn, query)
+    if cache is not False:
+        return shared_result(cache, f"postgres:{cred_prefix}", query, params, result_format,
+                             lambda: query_postgres(query, False, cred_prefix, params, use_copy, result_format, timeout, cache=False))
 
-        elif params:     
-            result_df = pd_execute_psql(conn, query, params)
-            
-        query_end(query, start_time)
+    if use_copy:
+        return copy_postgres(query, cred_prefix, params=params, result_format=result_format, timeout=timeout)
 
-        if isinstance(result_df.columns, pd.MultiIndex):
-            result_df.columns = [" | ".join(map(str, col)) for col in result_df.columns]
+    with get_pool("postgres", cred_prefix).connection() as conn:
+        if result_format != "pandas":
+            result_table = pd_execute_psql(conn, query, params or None, result_format="arrow", timeout=timeout)
 
-        if isinstance(result_df.index, pd.MultiIndex):
-            result_df = result_df.reset_index()
+        elif not params: 
+            result_df = pd_execute_psql(conn, query, timeout=timeout)
 
-        # Flatten lists in DataFrame
-        for col in result_df.columns:
-            if result_df[col].apply(lambda x: isinstance(x, list)).any():
-                result_df[col] = result_df[col].apply(lambda x: ', '.join(map(str, x)) if isinstance(x, list) else x)
+        elif params:     
+            result_df = pd_execute_psql(conn, query, params, timeout=timeout)
         
-        return result_df
+    query_end(query, start_time)
+
+    if result_format != "pandas":
+        # Flatten lists into strings, as below for pandas results
+        result_table = flatten_list_columns(result_table)
+        return result_table if result_format == "arrow" else arrow_to_pandas(result_table)
+
+    if isinstance(result_df.columns, pd.MultiIndex):
+        result_df.columns = [" | ".join(map(str, col)) for col in result_df.columns]
+
+    if isinstance(result_df.index, pd.MultiIndex):
+        result_df = result_df.reset_index()
+
+    # Flatten lists in DataFrame
+    for col in result_df.columns:
+        if result_df[col].apply(lambda x: isinstance(x, list)).any():
+            result_df[col] = result_df[col].apply(lambda x: ', '.join(map(str, x)) if isinstance(x, list) else x)
     
+    return result_df
+
+
+def _bulk_value(value):
+    """Turn pandas/numpy scalars into plain Python values, with every kind of missing value as None."""
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        return value.item()
+    return value
+
+
+def _copy_text_row(row) -> str:
+    """Format one row for COPY ... FROM STDIN in text format (tab separated, \\N for NULL)."""
+    fields = []
+    for value in row:
+        if value is None:
+            fields.append("\\N")
+        else:
+            text = str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+            fields.append(text)
+    return "\t".join(fields) + "\n"
+
+
+def bulk_load(table_name: str, rows: Union[pd.DataFrame, Iterable], cred_prefix: str, backend: str = "postgres",
+              columns: Optional[List[str]] = None,
+              batch_size: Optional[int] = None, truncate: bool = False, timeout: Optional[float] = None) -> int:
+    """
+    Write a DataFrame or an iterable of row tuples into an existing table and return the number of rows loaded.
+
+    Postgres rows are streamed with COPY ... FROM STDIN, Redshift rows are sent
+    as multi-row INSERT statements, batch_size rows at a time (by default
+    DEFAULT_COPY_BATCH_ROWS / DEFAULT_INSERT_BATCH_ROWS). Every batch runs in
+    one transaction, so a failure leaves the table as it was. cred_prefix is
+    the environment prefix as for query_prepared ("REDSHIFT" for Redshift). columns defaults
+    to the DataFrame's columns; for plain rows without columns the values must
+    follow the table's column order. Values are written as they are, so
+    integer columns with missing values should use pandas' nullable Int64
+    dtype (a float64 column writes 1.0). truncate empties the table first in the
+    same transaction (with DELETE on Redshift, where TRUNCATE commits).
+    Meant for small and medium tables such as reference data; large loads
+    should still go through S3 and COPY.
+    """
+    if backend not in ("postgres", "redshift"):
+        raise ValueError(f"Bulk load is supported for postgres and redshift, not '{backend}'.")
+    batch_size = batch_size or (DEFAULT_COPY_BATCH_ROWS if backend == "postgres" else DEFAULT_INSERT_BATCH_ROWS)
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+    if backend == "postgres":
+        timeout = default_timeout(timeout)
+
+    if isinstance(rows, pd.DataFrame):
+        columns = columns or [str(column) for column in rows.columns]
+        rows = rows.itertuples(index=False, name=None)
+    column_list = f" ({', '.join(columns)})" if columns else ""
+    rows = iter(rows)
+
+    start_time = perf_counter()
+    total_rows = 0
+
+    with get_pool(backend, cred_prefix).connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                set_statement_timeout(cursor, timeout)
+                if truncate:
+                    cursor.execute(f"TRUNCATE {table_name}" if backend == "postgres" else f"DELETE FROM {table_name}")
+
+                while True:
+                    batch = [tuple(_bulk_value(value) for value in row) for row in itertools.islice(rows, batch_size)]
+                    if not batch:
+                        break
+
+                    with cancel_after(conn.cancel, timeout):
+                        if backend == "postgres":
+                            buffer = io.StringIO("".join(_copy_text_row(row) for row in batch))
+                            cursor.copy_expert(f"COPY {table_name}{column_list} FROM STDIN", buffer)
+                        else:
+                            psycopg2.extras.execute_values(
+                                cursor, f"INSERT INTO {table_name}{column_list} VALUES %s", batch, page_size=batch_size
+                            )
+
+                    total_rows += len(batch)
+                    logger.info(f"Loaded {total_rows} rows into {table_name}")
+
+            conn.commit()
+
+        except psycopg2.errors.QueryCanceled as e:
+            conn.rollback()
+            raise TimeoutError(f"Bulk load exceeded {timeout} seconds and was cancelled.") from e
+
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+    query_end(f"bulk_load {table_name}", start_time)
+    return total_rows
+
+
+# psycopg2 placeholders: %(name)s, %s and the %% escape
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def to_positional(sql: str) -> Tuple[str, list]:
+    """
+    Rewrite psycopg2 placeholders to the $1, $2, ... form PREPARE expects.
+    Returns the rewritten SQL and, for each $n, the params key (name) or index it binds.
+    A named parameter used more than once keeps a single $n. Inside string
+    literals only the %% escape is undone, so LIKE '%%smith%%' keeps its wildcards.
+    """
+    keys = []
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1) is None:
+            keys.append(len(keys))
+            return f"${len(keys)}"
+        if match.group(1) not in keys:
+            keys.append(match.group(1))
+        return f"${keys.index(match.group(1)) + 1}"
+
+    parts = _SQL_LITERAL.split(sql)
+    for index, part in enumerate(parts):
+        parts[index] = _PLACEHOLDER.sub(replace, part) if index % 2 == 0 else part.replace("%%", "%")
+    positional_sql = "".join(parts)
+
+    if any(isinstance(key, int) for key in keys) and any(isinstance(key, str) for key in keys):
+        raise ValueError("Cannot mix %s and %(name)s placeholders in one query")
+    return positional_sql, keys
+
+
+def pd_execute_prepared(conn: psycopg2.extensions.connection, state: dict, sql: str, params=None,
+                        backend: str = "postgres", result_format: str = "pandas",
+                        timeout: Optional[float] = None):
+    """
+    Execute a query as a named server-side prepared statement on a pooled connection.
+
+    The statement is PREPAREd the first time this connection sees the SQL text
+    and its name is remembered in the pool's per-connection state, so later
+    calls only send EXECUTE with the parameter values and skip parse and plan.
+    Prepared statements live for the session, so they survive the rollback the
+    pool runs on release and are dropped with the connection.
+    """
+    prepared = state.setdefault("prepared_statements", {})
+    # Like cursor.execute, SQL run without params is sent as is (no placeholders, no %% escapes)
+    positional_sql, keys = to_positional(sql) if params is not None else (sql, [])
+    values = [params[key] for key in keys] if keys else []
+
+    with conn.cursor() as cursor:
+        set_statement_timeout(cursor, timeout)
+
+        name = prepared.get(sql)
+        if name is None:
+            name = f"stmt_{hashlib.sha1(sql.encode('utf-8')).hexdigest()[:16]}"
+            logger.info(f"Preparing statement {name}: {sql}")
+            cursor.execute(f"PREPARE {name} AS {positional_sql}")
+            prepared[sql] = name
+
+        execute_sql = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * len(values))})" if values else "")
+        with cancel_after(conn.cancel, timeout):
+            cursor.execute(execute_sql, values or None)
+        records = cursor.fetchall()
+        return build_result(records, cursor.description, backend, result_format)
+
+
+def query_prepared(query: str, cred_prefix: str, params=None, backend: str = "postgres",
+                   result_format: str = "pandas", timeout: Optional[float] = None):
+    """
+    Run a read query on PostgreSQL or Redshift as a prepared statement cached per pooled connection.
+
+    Use it for SQL that is run many times with different parameter values
+    (%s or %(name)s placeholders, as with query_postgres). Only values can be
+    parameters: SQL that differs by identifier, such as a schema name rendered
+    into the text, is a different statement with its own plan. timeout follows
+    query_postgres for postgres and query_redshift (no default limit) for redshift.
+    Trino is not supported: it analyzes and plans each EXECUTE again, so a
+    cached PREPARE saves nothing there.
+    """
+    if backend not in ("postgres", "redshift"):
+        raise ValueError(f"Prepared statements are supported for postgres and redshift, not '{backend}'.")
+    validate_result_format(result_format)
+    start_time = perf_counter()
+    if backend == "postgres":
+        timeout = default_timeout(timeout)
+
+    pool = get_pool(backend, cred_prefix)
+    try:
+        with pool.connection() as conn:
+            state = pool.state(conn)
+            try:
+                result = pd_execute_prepared(conn, state, query, params, backend, result_format, timeout)
+            except psycopg2.errors.InvalidSqlStatementName:
+                # The session lost the statement (e.g. a server-side reset); prepare it again once
+                conn.rollback()
+                state.pop("prepared_statements", None)
+                result = pd_execute_prepared(conn, state, query, params, backend, result_format, timeout)
+
+    except psycopg2.errors.QueryCanceled as e:
+        raise TimeoutError(f"Query execution exceeded {timeout} seconds and was cancelled.") from e
+
+    query_end(query, start_time)
+    return result
+
+
+# Name of the temporary table query_with_vector filters on; one per transaction, so it never changes the query text
+VECTOR_TABLE_NAME = "query_vector"
+
+
+def load_vector_table(conn: psycopg2.extensions.connection, values: List, column_type: Optional[str] = None) -> str:
+    """
+    COPY values into the single-column temporary table VECTOR_TABLE_NAME on conn and return its name.
+    column_type should match the column being filtered; by default it is bigint when every
+    value is an int and text otherwise. The values are sent as text, so string ids load into
+    a bigint table. The table is created ON COMMIT DROP, so it disappears when the pooled
+    connection is reset.
+    """
+    if column_type is None:
+        column_type = "bigint" if all(isinstance(value, int) and not isinstance(value, bool) for value in values) else "text"
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for value in values:
+        writer.writerow([value])
+    buffer.seek(0)
+
+    with conn.cursor() as cursor:
+        # A table left by an earlier load in the same transaction is replaced
+        cursor.execute(
+            f"DROP TABLE IF EXISTS pg_temp.{VECTOR_TABLE_NAME}; "
+            f"CREATE TEMPORARY TABLE {VECTOR_TABLE_NAME} (value {column_type}) ON COMMIT DROP"
+        )
+        cursor.copy_expert(f"COPY {VECTOR_TABLE_NAME} (value) FROM STDIN WITH (FORMAT csv)", buffer)
+        # Give the planner real row counts so it picks a hash semi-join for the IN (SELECT ...)
+        cursor.execute(f"ANALYZE {VECTOR_TABLE_NAME}")
+
+    logger.info(f"Loaded {len(values)} values into temporary table {VECTOR_TABLE_NAME} ({column_type})")
+    return VECTOR_TABLE_NAME
+
+
+def query_with_vector(query: str, cred_prefix: str, column: str, values: List, params: Optional[dict] = None,
+                      column_type: Optional[str] = None, result_format: str = "pandas",
+                      timeout: Optional[float] = None) -> pd.DataFrame:
+    """
+    Run a PostgreSQL read filtered on a list of values without pasting the list into the SQL.
+
+    The query marks where the filter goes with {vector_filter}, e.g.
+    "SELECT * FROM claims WHERE {vector_filter} AND paid > %(min_paid)s".
+    The values are COPYed into a temporary table on the same connection and
+    matched with "column IN (SELECT value FROM query_vector)", so the query
+    text is the same however many values there are. (Binding the list as one
+    array parameter would not help: psycopg2 interpolates parameters client
+    side, so the array literal would end up in the SQL text anyway.)
+    Pass column_type (e.g. "integer", "varchar") when it differs from what the
+    values suggest, such as string ids filtering an integer column; see load_vector_table.
+    The query is always run with parameters, so literal % signs must be written as %%.
+    """
+    validate_result_format(result_format)
+    start_time = perf_counter()
+
+    # Drop duplicates (keeping order) and NULLs, which never match an equality filter
+    values = [value for value in dict.fromkeys(values) if value is not None]
+    params = dict(params or {})
+
+    with get_pool("postgres", cred_prefix).connection() as conn:
+        if values:
+            vector_filter = f"{column} IN (SELECT value FROM {load_vector_table(conn, values, column_type)})"
+        else:
+            vector_filter = "FALSE"
+
+        sql = query.replace("{vector_filter}", vector_filter)
+        result = pd_execute_psql(conn, sql, params, result_format=result_format, timeout=timeout)
+
     query_end(query, start_time)
+    return result
 
 
+def iter_postgres_chunks(query: str, cred_prefix: str, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                         params = None, timeout: Optional[float] = None) -> Iterator[pd.DataFrame]:
+    """
+    Stream a PostgreSQL query as DataFrames of at most chunk_rows rows.
+
+    Uses a named (server-side) cursor, so only one chunk is held client side
+    at a time. The pooled connection stays checked out until the generator
+    is exhausted or closed. If the query returns no rows a single empty
+    DataFrame with the result columns is yielded so callers can still write
+    a header. timeout applies to each server round trip (query and fetches).
+    """
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows must be a positive integer")
+
+    start_time = perf_counter()
+    timeout = default_timeout(timeout)
+    total_rows = 0
 
+    with get_pool("postgres", cred_prefix).connection() as conn:
+        with conn.cursor() as settings_cursor:
+            set_statement_timeout(settings_cursor, timeout)
+
+        cursor = conn.cursor(name=f"chunk_cursor_{uuid4().hex}")
+        cursor.itersize = chunk_rows
+
+        try:
+            logger.info(f"Streaming query in chunks of {chunk_rows} rows: {query}")
+            cursor.execute(query, params)
+
+            while True:
+                with cancel_after(conn.cancel, timeout):
+                    records = cursor.fetchmany(chunk_rows)
+                # Named cursors only populate description after the first fetch
+                column_names = [desc[0] for desc in cursor.description]
+
+                if not records:
+                    if total_rows == 0:
+                        yield pd.DataFrame(columns=column_names)
+                    break
+
+                total_rows += len(records)
+                yield pd.DataFrame(records, columns=column_names)
+
+        finally:
+            try:
+                cursor.close()
+            except Exception as e:
+                logger.warning(f"Error closing cursor: {e}")
+
+    logger.info(f"Streamed {total_rows} rows")
+    query_end(query, start_time)
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+import pandas as pd
+
+from typing import Callable, Dict, Optional, Union
+from dotenv import load_dotenv
+
+from .arrow_results import arrow_to_pandas
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed when the result cache is enabled
+    pa = None
+    pq = None
+
+
+logger = logging.getLogger(__name__)
+
+# Cache defaults, each can be overridden through the environment (.env)
+DEFAULT_CACHE_TTL_SECONDS = 3600
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Parquet schema metadata key holding the time the result was stored
+_CREATED_AT_KEY = b"query_cache_created_at"
+
+# Single quoted SQL literals, including '' escapes
+_SQL_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Collapse whitespace outside string literals and drop a trailing semicolon,
+    so formatting-only differences map to the same cache key.
+    """
+    parts = _SQL_LITERAL.split(sql)
+    for index in range(0, len(parts), 2):
+        parts[index] = re.sub(r"\s+", " ", parts[index])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def query_key(backend: str, sql: str, params=None) -> str:
+    """sha256 identifying a query: backend label, normalized SQL and parameters."""
+    payload = json.dumps([backend, normalize_sql(sql), params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk cache of query results, stored as one Parquet file per query.
+
+    Keys are a sha256 of the backend label, the normalized SQL and the
+    parameters. Entries older than ttl seconds are treated as misses and
+    removed. Reading an entry refreshes its modification time, and once the
+    directory grows past max_bytes the least recently used files are evicted.
+    Writes go through a temporary file and an atomic rename, so concurrent
+    runs sharing a directory never read a partial file.
+    """
+
+    def __init__(self, directory: str, ttl: float = DEFAULT_CACHE_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        if pa is None:
+            raise ImportError("pyarrow is required for the query result cache.")
+
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, backend: str, sql: str, params=None) -> str:
+        """Cache key for a query on a backend (e.g. "postgres:CLAIMS")."""
+        return query_key(backend, sql, params)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str, result_format: str = "pandas"):
+        """
+        Return the cached result in the requested format, or None on a miss or an expired entry.
+        """
+        path = self._path(key)
+        try:
+            metadata = pq.read_schema(path).metadata or {}
+            created_at = float(metadata.get(_CREATED_AT_KEY, 0))
+            if time.time() - created_at > self.ttl:
+                self._remove(path)
+                table = None
+            else:
+                table = pq.read_table(path)
+                os.utime(path)  # mark as recently used for LRU eviction
+        except (FileNotFoundError, pa.ArrowInvalid, OSError):
+            table = None
+
+        with self._lock:
+            if table is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        logger.info(f"Query result served from cache ({key[:12]}, {table.num_rows} rows)")
+        if result_format == "arrow":
+            return table
+        if result_format == "arrow_pandas":
+            return arrow_to_pandas(table)
+        return table.to_pandas()
+
+    def put(self, key: str, result: Union[pd.DataFrame, "pa.Table"]) -> None:
+        """
+        Store a result. Results that cannot be represented in Arrow (e.g. mixed-type
+        object columns) are skipped with a warning rather than failing the query.
+        """
+        if result is None:
+            return
+        try:
+            table = result if isinstance(result, pa.Table) else pa.Table.from_pandas(result, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            logger.warning(f"Query result not cached, it cannot be converted to Arrow: {e}")
+            return
+
+        metadata = dict(table.schema.metadata or {})
+        metadata[_CREATED_AT_KEY] = str(time.time()).encode("utf-8")
+        table = table.replace_schema_metadata(metadata)
+
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            pq.write_table(table, temp_path)
+            os.replace(temp_path, path)
+        except Exception as e:
+            self._remove(temp_path)
+            logger.warning(f"Could not write query result to cache: {e}")
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".parquet"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self) -> None:
+        """Remove every cached result."""
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".parquet"):
+                self._remove(entry.path)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counts and the on-disk size for observability."""
+        size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".parquet"))
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": size, "max_bytes": self.max_bytes}
+
+
+_default_cache: Optional[ResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    Return the process-wide cache configured by QUERY_CACHE_DIR, or None when caching is not enabled.
+    QUERY_CACHE_TTL_SECONDS and QUERY_CACHE_MAX_BYTES override the defaults.
+    """
+    global _default_cache
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            load_dotenv()
+            directory = os.getenv("QUERY_CACHE_DIR")
+            if not directory:
+                return None
+            _default_cache = ResultCache(
+                directory,
+                ttl=float(os.getenv("QUERY_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS)),
+                max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)),
+            )
+            logger.info(f"Query result cache enabled in {_default_cache.directory}")
+
+    return _default_cache
+
+
+def cached_result(cache: Union[None, bool, ResultCache], backend: str, query: str, params,
+                  result_format: str, run: Callable):
+    """
+    Serve a read query from the result cache, running it and storing the result on a miss.
+
+    cache=None (or True) uses the QUERY_CACHE_DIR cache when one is configured,
+    False bypasses caching, and a ResultCache instance uses that cache.
+    """
+    if cache is False:
+        return run()
+
+    result_cache = cache if isinstance(cache, ResultCache) else get_result_cache()
+    if result_cache is None:
+        return run()
+
+    key = result_cache.key(backend, query, params)
+    result = result_cache.get(key, result_format)
+    if result is None:
+        result = run()
+        result_cache.put(key, result)
+    return result
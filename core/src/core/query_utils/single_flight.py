@@ -0,0 +1,108 @@
+import logging
+import threading
+import pandas as pd
+
+from typing import Callable, Dict, Hashable, Union
+
+from .result_cache import ResultCache, cached_result, get_result_cache, query_key
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight execution that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None  # snapshot handed to waiters, never returned to the leader's caller
+        self.error = None
+
+
+def _copy_result(result):
+    # DataFrames are mutable, so every waiter gets its own copy; Arrow tables are immutable
+    if isinstance(result, pd.DataFrame):
+        return result.copy()
+    return result
+
+
+class SingleFlight:
+    """
+    Deduplicates identical calls that are in flight at the same time.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for it and receive a copy of its result (or its exception)
+    instead of running it again. Once the call finishes the key is forgotten,
+    so later calls run again (use the result cache to reuse finished results).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable):
+        """Run fn for key, or wait for the identical call already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            logger.info(f"Waiting for identical in-flight query ({str(key)[:12]})")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return _copy_result(call.result)
+
+        result = None
+        try:
+            result = fn()
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            # Snapshot before the leader's caller gets the result, so its changes never reach the waiters
+            if waiters and call.error is None:
+                call.result = _copy_result(result)
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Return execution/coalesce counts and the number of calls currently in flight."""
+        with self._lock:
+            return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+# Process-wide instance shared by the query functions
+single_flight = SingleFlight()
+
+
+def shared_result(cache: Union[None, bool, ResultCache], backend: str, query: str, params,
+                  result_format: str, run: Callable):
+    """
+    Run a read query at most once across concurrent identical requests, going
+    through the result cache (see cached_result) inside the single flight so
+    concurrent cache misses also share one execution.
+    """
+    key = f"{query_key(backend, query, params)}:{result_format}"
+    return single_flight.do(key, lambda: cached_result(cache, backend, query, params, result_format, run))
+
+
+def query_stats() -> Dict[str, Dict[str, int]]:
+    """Coalescing counters together with the result cache stats (when a cache is configured)."""
+    result_cache = get_result_cache()
+    return {
+        "single_flight": single_flight.stats(),
+        "result_cache": result_cache.stats() if result_cache is not None else {},
+    }
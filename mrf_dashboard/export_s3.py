@@ -1,13 +1,37 @@
 import boto3
+import io
 import os
+import re
+import gzip
 import json
+import shutil
+import hashlib
 import logging
+import tempfile
+import threading
 import subprocess
+import pandas as pd
 
+from typing import NamedTuple
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import NoCredentialsError, ClientError, PartialCredentialsError
 from core.query_utils import query_redshift
 from dotenv import load_dotenv
 
+try:
+    import zstandard
+except ImportError:  # zstandard is only needed for compression="zstd"
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for the parquet output format
+    pa = None
+
 dotenv_path = "/Users/blayton/Documents/env/.env"
 load_dotenv(dotenv_path)
 
@@ -21,44 +45,239 @@ def run_aws_sso_login():
     except subprocess.CalledProcessError as e:
         print(f"An error occurred during SSO login: {e}")
 
+# Connection pool size of the shared client, sized for parallel per-customer uploads
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+# Rebuild the client this many seconds before its credentials expire
+CREDENTIAL_REFRESH_MARGIN = 300
+
+_s3_client = None
+_s3_credentials = None
+_s3_lock = threading.Lock()
+
+
+def _credentials_expiring(credentials):
+    """True when refreshable (SSO/role) credentials are within the refresh margin of expiring."""
+    return isinstance(credentials, RefreshableCredentials) and credentials.refresh_needed(CREDENTIAL_REFRESH_MARGIN)
+
+
+def get_s3_client(force_refresh=False):
+    """
+    Returns the process-wide S3 client, creating it on first use.
+
+    boto3 clients are thread-safe, so one client (and its connection pool) is
+    shared by every upload. The SSO profile session is resolved once and
+    rebuilt only when its credentials are about to expire or when
+    force_refresh is set.
+    """
+    global _s3_client, _s3_credentials
+
+    with _s3_lock:
+        if _s3_client is None or force_refresh or _credentials_expiring(_s3_credentials):
+            # Initialize the Boto3 session using the SSO profile
+            session = boto3.Session(profile_name=aws_sso)
+
+            # Force the credentials to load
+            credentials = session.get_credentials()
+
+            # Ensure that credentials are valid
+            if credentials is None or credentials.get_frozen_credentials() is None:
+                print("No valid credentials found. Please authenticate via AWS SSO.")
+                raise NoCredentialsError()
+
+            _s3_client = session.client(
+                's3',
+                config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, retries={'mode': 'standard'}),
+            )
+            _s3_credentials = credentials
+            logging.getLogger(__name__).info("Created S3 client from AWS SSO profile.")
+
+        return _s3_client
+
+
 def connect_s3():
-    # Initialize the Boto3 session using the SSO profile
-    session = boto3.Session(profile_name=aws_sso)
+    """Kept for existing callers; returns the shared client from get_s3_client()."""
+    return get_s3_client()
 
-    # Force the credentials to load
-    credentials = session.get_credentials()
 
-    # Ensure that credentials are valid
-    if credentials is None or credentials.get_frozen_credentials() is None:
-        print("No valid credentials found. Please authenticate via AWS SSO.")
+# S3 requires every multipart part except the last to be at least 5 MiB
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+# Object metadata key holding the MD5 of the full object body
+CONTENT_HASH_METADATA_KEY = "content-md5"
+# Part size a streamed multipart object was written with; its ETag only compares equal at the same part size
+PART_SIZE_METADATA_KEY = "part-size"
+
+
+# File suffix and Redshift COPY option for each supported compression
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+COPY_COMPRESSION_OPTIONS = {"gzip": "GZIP", "zstd": "ZSTD"}
+
+
+def check_compression(compression):
+    """Raises for unknown compressions, and for zstd when the zstandard package is missing."""
+    if compression is not None and compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unsupported compression '{compression}'. Expected one of {list(COMPRESSION_SUFFIXES)}.")
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("zstandard is required for compression='zstd'.")
 
-    else:
-        # Create an S3 client with the credentials
-        s3 = session.client('s3')
 
-    return s3
+def compressed_key(s3_key, compression):
+    """Appends the file suffix for the compression (.gz/.zst) to an S3 key."""
+    return s3_key + COMPRESSION_SUFFIXES[compression] if compression else s3_key
 
 
-def write_to_s3(file_name, bucket_name, s3_key):
-    """Writes csv to bucket, s3_key describes directory path."""
-    s3 = connect_s3()
+OUTPUT_FORMATS = ("csv", "parquet")
+# Every key suffix an export can be written with, longest first so stripping finds the full suffix
+EXPORT_SUFFIXES = [".csv" + suffix for suffix in COMPRESSION_SUFFIXES.values()] + [".csv", ".parquet"]
+
+
+def output_key(s3_key, output_format="csv", compression=None):
+    """Returns the S3 key for an export: name.csv[.gz|.zst] for CSV, name.parquet for Parquet."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{output_format}'. Expected one of {OUTPUT_FORMATS}.")
+    if output_format == "parquet":
+        return f"{os.path.splitext(s3_key)[0]}.parquet"
+    return compressed_key(s3_key, compression)
+
+
+def add_copy_option(copy_query, option):
+    """Appends an option (e.g. GZIP, MANIFEST) to a Redshift COPY statement unless it is already there."""
+    # Quoted literals (the S3 URL, the role) are ignored, a key such as t.manifest is not the option
+    if re.search(rf"\b{option}\b", re.sub(r"'[^']*'", "''", copy_query), re.IGNORECASE):
+        return copy_query
+    return f"{copy_query.rstrip().rstrip(';')} {option};"
+
+
+def copy_with_compression(copy_query, compression):
+    """Adds the GZIP/ZSTD option matching compression to a Redshift COPY statement."""
+    if not compression:
+        return copy_query
+    return add_copy_option(copy_query, COPY_COMPRESSION_OPTIONS[compression])
+
+
+def compressor(fileobj, compression):
+    """
+    Wraps fileobj in a compressing writer, or returns None for no compression.
+    Closing the writer ends the compressed stream but leaves fileobj open.
+    """
+    check_compression(compression)
+    if compression == "gzip":
+        # mtime=0 keeps the gzip header, and so the content hash, stable between runs
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", mtime=0)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+    return None
+
+
+class UploadResult(NamedTuple):
+    """Outcome of an S3 write. changed is False when the upload was skipped or the content was identical."""
+    s3_key: str
+    content_length: int
+    etag: str
+    changed: bool
+
+
+def multipart_etag(part_digests, multipart):
+    """ETag S3 assigns to an object: the body MD5 for a single PUT, md5(part MD5s)-N for a multipart upload."""
+    if not multipart:
+        return part_digests[0].hex()
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def file_content_hash(file_name, part_size=DEFAULT_PART_SIZE):
+    """Returns (md5 hex, expected ETag, size) for a local file uploaded with the given multipart part size."""
+    full_md5 = hashlib.md5()
+    part_digests = []
+    size = 0
+
+    with open(file_name, 'rb') as file:
+        while True:
+            part = file.read(part_size)
+            if not part and part_digests:
+                break
+            full_md5.update(part)
+            part_digests.append(hashlib.md5(part).digest())
+            size += len(part)
+            if len(part) < part_size:
+                break
+
+    # upload_file switches to multipart once the file reaches the threshold (set to part_size below)
+    return full_md5.hexdigest(), multipart_etag(part_digests, size >= part_size), size
+
+
+def existing_object_hash(s3, bucket_name, s3_key):
+    """Returns (stored content hash, ETag) of an existing object, or (None, None) if it does not exist."""
+    try:
+        response = s3.head_object(Bucket=bucket_name, Key=s3_key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None, None
+        raise
+
+    return response.get('Metadata', {}).get(CONTENT_HASH_METADATA_KEY), response['ETag'].strip('"')
+
+
+def compress_file(file_name, compression):
+    """Writes a compressed copy of file_name to a temporary file and returns its path."""
+    handle, compressed_name = tempfile.mkstemp(suffix=COMPRESSION_SUFFIXES[compression])
+    with os.fdopen(handle, 'wb') as output, open(file_name, 'rb') as source:
+        with compressor(output, compression) as encoder:
+            shutil.copyfileobj(source, encoder, DEFAULT_PART_SIZE)
+    return compressed_name
+
+
+def existing_upload(bucket_name, s3_key):
+    """Describes an object already in S3 as an unchanged UploadResult, or returns None if it does not exist."""
+    try:
+        response = get_s3_client().head_object(Bucket=bucket_name, Key=s3_key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return UploadResult(s3_key, response['ContentLength'], response['ETag'].strip('"'), False)
+
+
+def write_to_s3(file_name, bucket_name, s3_key, skip_unchanged=True, compression=None):
+    """Writes csv to bucket, s3_key describes directory path.
+    With compression ("gzip" or "zstd") the file is compressed before upload; pass a key
+    built with compressed_key() so the object carries the matching suffix.
+    The upload is skipped when the existing object already has the same content hash.
+    Returns an UploadResult, or None if the upload failed."""
+    check_compression(compression)
+    if compression:
+        compressed_name = compress_file(file_name, compression)
+        try:
+            return write_to_s3(compressed_name, bucket_name, s3_key, skip_unchanged)
+        finally:
+            os.remove(compressed_name)
+
+    s3 = get_s3_client()
+    content_hash, etag, size = file_content_hash(file_name)
 
     #Check if file is already in S3
     try:
-        s3.head_object(Bucket=bucket_name, Key=s3_key)
-        print(f"File '{s3_key}' already exists in bucket '{bucket_name}'. It will be overwritten.")
+        existing_hash, existing_etag = existing_object_hash(s3, bucket_name, s3_key)
 
     except ClientError as e:
-        if e.response['Error']['Code'] == '404':
-            print(f"File '{s3_key}' does not exist in bucket '{bucket_name}'. Uploading new file.")
-        else:
-            print(f"Error occurred while checking for file: {e}")
-            return
+        print(f"Error occurred while checking for file: {e}")
+        return
+
+    if existing_etag is None:
+        print(f"File '{s3_key}' does not exist in bucket '{bucket_name}'. Uploading new file.")
+    elif skip_unchanged and (content_hash in (existing_hash, existing_etag) or etag == existing_etag):
+        print(f"File '{s3_key}' is unchanged in bucket '{bucket_name}'. Skipping upload.")
+        return UploadResult(s3_key, size, existing_etag, False)
+    else:
+        print(f"File '{s3_key}' already exists in bucket '{bucket_name}'. It will be overwritten.")
 
-    # Upload the file to S3
+    # Upload the file to S3, with the part size used to compute the expected ETag
     try:
-        s3.upload_file(file_name, bucket_name, s3_key)
+        s3.upload_file(
+            file_name, bucket_name, s3_key,
+            ExtraArgs={'Metadata': {CONTENT_HASH_METADATA_KEY: content_hash}},
+            Config=TransferConfig(multipart_threshold=DEFAULT_PART_SIZE, multipart_chunksize=DEFAULT_PART_SIZE),
+        )
         print(f"File {file_name} uploaded successfully to {bucket_name}/{s3_key}")
+        return UploadResult(s3_key, size, etag, True)
         
     except NoCredentialsError:
         print("Error: Unable to locate valid credentials.")
@@ -66,6 +285,443 @@ def write_to_s3(file_name, bucket_name, s3_key):
         print(f"Error uploading file: {e}")
 
 
+class S3StreamWriter:
+    """
+    Writes a CSV (optionally gzip or zstd compressed) to S3 straight from memory.
+
+    DataFrame chunks (write_frame) or raw bytes (write, so the writer can be
+    passed as a file object, e.g. to copy_postgres) are encoded into an
+    in-memory buffer that is pushed as an S3 multipart part every time it
+    reaches part_size. Small outputs that never fill a part are sent with a
+    single put_object. No local file is needed.
+
+    The body is hashed as it is written. With skip_unchanged, a single-part
+    object whose hash matches the existing object is not uploaded at all.
+    Multipart parts are sent as they fill, before the full hash is known, so
+    an unchanged multipart output still costs the upload traffic; its ETag is
+    compared with the existing object's before completing, and on a match
+    the upload is aborted so the object is not rewritten. Either way
+    result.changed reports whether the content moved.
+    """
+
+    def __init__(self, bucket_name, s3_key, compression=None, part_size=DEFAULT_PART_SIZE, s3=None,
+                 skip_unchanged=True):
+        check_compression(compression)
+        if part_size < 5 * 1024 * 1024:
+            raise ValueError("part_size must be at least 5 MiB.")
+
+        self.bucket_name = bucket_name
+        self.s3_key = s3_key
+        self.part_size = part_size
+        self.skip_unchanged = skip_unchanged
+        self.s3 = s3 or get_s3_client()
+
+        self._buffer = io.BytesIO()
+        self._encoder = compressor(self._buffer, compression)
+        self._upload_id = None
+        self._parts = []
+        self._part_digests = []
+        self._content_md5 = hashlib.md5()
+        self._existing_etag = None
+        self._header_written = False
+        self._position = 0
+        self.bytes_uploaded = 0
+        self.result = None
+
+    def write(self, data):
+        """Append already encoded bytes (file object interface)."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        (self._encoder or self._buffer).write(data)
+        self._position += len(data)
+        if self._buffer.tell() >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def tell(self):
+        """Number of bytes written so far, before compression."""
+        return self._position
+
+    def flush(self):
+        """Parts are pushed as the buffer fills; nothing to flush early."""
+
+    @property
+    def closed(self):
+        return self.result is not None
+
+    def write_frame(self, df):
+        """Append a DataFrame as CSV rows; the header is written with the first frame only."""
+        self.write(df.to_csv(index=False, header=not self._header_written))
+        self._header_written = True
+
+    def _take_buffer(self):
+        body = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._content_md5.update(body)
+        self._part_digests.append(hashlib.md5(body).digest())
+        return body
+
+    def _upload_part(self):
+        body = self._take_buffer()
+
+        if self._upload_id is None:
+            _, self._existing_etag = existing_object_hash(self.s3, self.bucket_name, self.s3_key)
+            # The full-body MD5 is not known yet, so multipart objects are matched on ETag (part size recorded here)
+            response = self.s3.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.s3_key,
+                Metadata={PART_SIZE_METADATA_KEY: str(self.part_size)},
+            )
+            self._upload_id = response["UploadId"]
+
+        part_number = len(self._parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket_name, Key=self.s3_key, UploadId=self._upload_id,
+            PartNumber=part_number, Body=body,
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.bytes_uploaded += len(body)
+
+    def close(self):
+        """Flush the remaining bytes and complete the upload, or skip/abort it when unchanged. Returns an UploadResult."""
+        if self._encoder is not None:
+            self._encoder.close()
+
+        if self._upload_id is None:
+            body = self._take_buffer()
+            content_hash = self._content_md5.hexdigest()
+
+            if self.skip_unchanged:
+                existing_hash, existing_etag = existing_object_hash(self.s3, self.bucket_name, self.s3_key)
+                if content_hash in (existing_hash, existing_etag):
+                    print(f"File '{self.s3_key}' is unchanged in bucket '{self.bucket_name}'. Skipping upload.")
+                    self.result = UploadResult(self.s3_key, len(body), existing_etag, False)
+                    return self.result
+
+            self.s3.put_object(
+                Bucket=self.bucket_name, Key=self.s3_key, Body=body,
+                Metadata={CONTENT_HASH_METADATA_KEY: content_hash},
+            )
+            self.bytes_uploaded += len(body)
+            self.result = UploadResult(self.s3_key, len(body), content_hash, True)
+        else:
+            if self._buffer.tell():
+                self._upload_part()
+            etag = multipart_etag(self._part_digests, True)
+
+            if self.skip_unchanged and etag == self._existing_etag:
+                self.abort()
+                print(f"File '{self.s3_key}' is unchanged in bucket '{self.bucket_name}'. Multipart upload aborted.")
+                self.result = UploadResult(self.s3_key, self.bytes_uploaded, etag, False)
+                return self.result
+
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=self.s3_key, UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+            self._upload_id = None
+            self.result = UploadResult(self.s3_key, self.bytes_uploaded, etag, etag != self._existing_etag)
+
+        print(f"Streamed {self.bytes_uploaded} bytes to {self.bucket_name}/{self.s3_key} in {max(len(self._parts), 1)} part(s)")
+        return self.result
+
+    def abort(self):
+        """Abandon the upload so no partial object or orphaned parts are left behind."""
+        if self._upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket_name, Key=self.s3_key, UploadId=self._upload_id)
+            self._upload_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+# Redshift types from the staging DDL, mapped to the Parquet column types COPY expects
+_DDL_ARROW_TYPES = {
+    "varchar": "string",
+    "character varying": "string",
+    "char": "string",
+    "character": "string",
+    "bpchar": "string",
+    "nvarchar": "string",
+    "text": "string",
+    "boolean": "bool",
+    "bool": "bool",
+    "smallint": "int16",
+    "int2": "int16",
+    "integer": "int32",
+    "int": "int32",
+    "int4": "int32",
+    "bigint": "int64",
+    "int8": "int64",
+    "real": "float32",
+    "float4": "float32",
+    "double precision": "float64",
+    "float8": "float64",
+    "float": "float64",
+    "date": "date",
+    "timestamp": "timestamp",
+    "timestamp without time zone": "timestamp",
+    "timestamptz": "timestamptz",
+    "timestamp with time zone": "timestamptz",
+    "decimal": "decimal",
+    "numeric": "decimal",
+}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for the parquet output format.")
+
+
+def _split_columns(column_list):
+    """Splits a DDL column list on the commas that are not inside parentheses (e.g. DECIMAL(34,2))."""
+    columns, depth, current = [], 0, ""
+    for char in column_list:
+        if char == "," and depth == 0:
+            columns.append(current.strip())
+            current = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        current += char
+    if current.strip():
+        columns.append(current.strip())
+    return columns
+
+
+def ddl_arrow_schema(staging_table_query):
+    """
+    Builds a pyarrow schema from a CREATE TABLE statement, keeping the column order
+    (Redshift matches Parquet columns by position). Unknown types fall back to string.
+    """
+    _require_pyarrow()
+    start, end = staging_table_query.find("("), staging_table_query.rfind(")")
+    if start == -1 or end <= start:
+        raise ValueError(f"Could not find a column list in: {staging_table_query}")
+
+    fields = []
+    for column in _split_columns(staging_table_query[start + 1:end]):
+        match = re.match(r'"?(\w+)"?\s+(.*)$', column, re.DOTALL)
+        if not match:
+            raise ValueError(f"Could not parse column definition '{column}'.")
+        name, definition = match.group(1), match.group(2).lower()
+
+        # Longest name first, so "timestamp with time zone" wins over "timestamp"
+        type_name = next(
+            (type_name for type_name in sorted(_DDL_ARROW_TYPES, key=len, reverse=True)
+             if re.match(rf"{type_name}\b", definition)),
+            None,
+        )
+        kind = _DDL_ARROW_TYPES.get(type_name, "string")
+        params = re.match(r"\s*\(([\d,\s]+)\)", definition[len(type_name):]) if type_name else None
+        params = params.group(1) if params else None
+
+        if kind == "decimal":
+            precision, scale = ([int(p) for p in params.split(",")] + [0])[:2] if params else (18, 0)
+            arrow_type = pa.decimal128(precision, scale)
+        else:
+            arrow_type = {
+                "string": pa.string(),
+                "bool": pa.bool_(),
+                "int16": pa.int16(),
+                "int32": pa.int32(),
+                "int64": pa.int64(),
+                "float32": pa.float32(),
+                "float64": pa.float64(),
+                "date": pa.date32(),
+                "timestamp": pa.timestamp("us"),
+                "timestamptz": pa.timestamp("us", tz="UTC"),
+            }[kind]
+        fields.append(pa.field(name.lower(), arrow_type))
+
+    return pa.schema(fields)
+
+
+def _conform_column(series, arrow_type):
+    """Converts one DataFrame column to arrow_type, parsing strings where needed."""
+    try:
+        array = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        array = pa.array([None if pd.isna(value) else str(value) for value in series], type=pa.string())
+
+    if array.type == arrow_type:
+        return array
+    if pa.types.is_boolean(arrow_type) and (pa.types.is_string(array.type) or pa.types.is_large_string(array.type)):
+        # Postgres renders booleans as t/f in text form
+        truthy = pc.is_in(pc.utf8_lower(array), value_set=pa.array(["t", "true", "1", "y", "yes"]))
+        return pc.if_else(pc.is_valid(array), truthy, pa.scalar(None, pa.bool_()))
+    # safe=False lets floats round into DECIMAL scales and nanosecond timestamps truncate to microseconds
+    return pc.cast(array, arrow_type, safe=False)
+
+
+def frame_to_arrow(df, schema):
+    """Builds an Arrow table with schema's column order and types from a DataFrame; missing columns are null."""
+    _require_pyarrow()
+    missing = [field.name for field in schema if field.name not in df.columns]
+    if missing:
+        logging.getLogger(__name__).warning(f"Columns missing from the DataFrame, written as null: {missing}")
+
+    arrays = [
+        _conform_column(df[field.name], field.type) if field.name in df.columns else pa.nulls(len(df), type=field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class ParquetStreamWriter:
+    """
+    Writes DataFrame chunks to S3 as one Parquet file with a fixed schema, one row group
+    per chunk, through an S3StreamWriter (so it is multipart, hashed and skipped when unchanged
+    the same way). Columns are compressed inside the file, so no outer compression is applied.
+    """
+
+    def __init__(self, bucket_name, s3_key, schema, compression="snappy", part_size=DEFAULT_PART_SIZE, s3=None,
+                 skip_unchanged=True):
+        _require_pyarrow()
+        self.schema = schema
+        self._stream = S3StreamWriter(bucket_name, s3_key, part_size=part_size, s3=s3, skip_unchanged=skip_unchanged)
+        self._writer = pq.ParquetWriter(self._stream, schema, compression=compression)
+
+    @property
+    def result(self):
+        return self._stream.result
+
+    def write_frame(self, df):
+        """Append a DataFrame as a row group, converted to the file schema."""
+        self._writer.write_table(frame_to_arrow(df, self.schema))
+
+    def close(self):
+        """Write the Parquet footer and complete (or skip) the upload. Returns an UploadResult."""
+        self._writer.close()
+        return self._stream.close()
+
+    def abort(self):
+        """Abandon the upload so no partial object or orphaned parts are left behind."""
+        self._stream.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def stream_dataframes_to_s3(frames, bucket_name, s3_key, compression=None, skip_unchanged=True, schema=None):
+    """Streams an iterable of DataFrame chunks to S3 as a single CSV object, or as Parquet when
+    a pyarrow schema is given. Returns an UploadResult."""
+    if schema is not None:
+        writer = ParquetStreamWriter(bucket_name, s3_key, schema, skip_unchanged=skip_unchanged)
+    else:
+        writer = S3StreamWriter(bucket_name, s3_key, compression=compression, skip_unchanged=skip_unchanged)
+
+    with writer:
+        for df in frames:
+            writer.write_frame(df)
+    return writer.result
+
+
+def parquet_copy_query(copy_query):
+    """
+    Rewrites a CSV COPY statement to load Parquet. Columnar COPY rejects the CSV
+    options (DELIMITER, IGNOREHEADER, TRUNCATECOLUMNS, ...), so only the target,
+    source and IAM role are kept.
+    """
+    match = re.match(r"\s*(COPY\s+\S+\s+FROM\s+'[^']*'\s+IAM_ROLE\s+'[^']*')", copy_query, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Could not rewrite COPY statement for Parquet: {copy_query}")
+    return f"{match.group(1)} FORMAT AS PARQUET;"
+
+
+def write_copy_manifest(bucket_name, manifest_key, uploads, skip_unchanged=True):
+    """
+    Writes a Redshift COPY manifest listing exactly the given uploads (UploadResults), with
+    their content lengths, so the load reads only this run's objects. Entries are sorted by
+    key, which keeps the manifest (and its hash) stable when nothing changed. Returns the
+    manifest's UploadResult; changed is True when the set of objects or their sizes moved.
+    """
+    manifest = {
+        "entries": [
+            {
+                "url": f"s3://{bucket_name}/{upload.s3_key}",
+                "mandatory": True,
+                "meta": {"content_length": upload.content_length},
+            }
+            for upload in sorted(uploads, key=lambda upload: upload.s3_key)
+        ]
+    }
+
+    with S3StreamWriter(bucket_name, manifest_key, skip_unchanged=skip_unchanged) as writer:
+        writer.write(json.dumps(manifest, indent=2))
+    return writer.result
+
+
+def repoint_copy_source(copy_query, s3_url):
+    """Replaces the FROM 's3://...' source of a COPY statement."""
+    repointed, replaced = re.subn(
+        r"(\bFROM\s+)'[^']*'", lambda match: f"{match.group(1)}'{s3_url}'", copy_query, count=1, flags=re.IGNORECASE
+    )
+    if not replaced:
+        raise ValueError(f"Could not find the FROM source in COPY statement: {copy_query}")
+    return repointed
+
+
+def read_json_from_s3(bucket_name, s3_key):
+    """Returns the parsed JSON object stored at s3_key, or None if it does not exist."""
+    try:
+        response = get_s3_client().get_object(Bucket=bucket_name, Key=s3_key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return json.loads(response['Body'].read())
+
+
+def write_json_to_s3(bucket_name, s3_key, obj):
+    """Stores obj as JSON at s3_key (skipped when the content is unchanged). Returns the UploadResult."""
+    with S3StreamWriter(bucket_name, s3_key) as writer:
+        writer.write(json.dumps(obj, indent=2, sort_keys=True, default=str))
+    return writer.result
+
+
+def manifest_copy_query(copy_query, bucket_name, manifest_key):
+    """Points a COPY statement's FROM at a manifest object and adds the MANIFEST option."""
+    return add_copy_option(repoint_copy_source(copy_query, f"s3://{bucket_name}/{manifest_key}"), "MANIFEST")
+
+
+def delete_stale_variants(bucket_name, s3_keys):
+    """
+    Deletes the copies of s3_keys written in another format or compression (e.g. the plain
+    .csv left behind after switching to .csv.gz or .parquet), so a prefix COPY never reads both.
+    s3_keys are the keys just written, including their suffix.
+    """
+    stale_keys = []
+    for s3_key in s3_keys:
+        suffix = next((suffix for suffix in EXPORT_SUFFIXES if s3_key.endswith(suffix)), "")
+        stem = s3_key[:len(s3_key) - len(suffix)]
+        stale_keys.extend(stem + other for other in EXPORT_SUFFIXES if stem + other != s3_key)
+
+    s3 = get_s3_client()
+    # delete_objects takes at most 1000 keys per request; missing keys are not an error
+    for index in range(0, len(stale_keys), 1000):
+        batch = stale_keys[index:index + 1000]
+        response = s3.delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+        )
+        for error in response.get('Errors', []):
+            print(f"Could not delete stale object '{error['Key']}': {error['Message']}")
+
+
 def delete_file_from_s3(bucket_name, file_key):
     """
     Deletes a file from the specified S3 bucket.
@@ -74,8 +730,7 @@ def delete_file_from_s3(bucket_name, file_key):
     :param file_key: Key (path) of the file in the bucket.
     """
     try:
-        # Initialize the S3 client
-        s3_client = boto3.client('s3')
+        s3_client = get_s3_client()
 
         # Delete the file
         response = s3_client.delete_object(Bucket=bucket_name, Key=file_key)
@@ -90,24 +745,28 @@ def delete_file_from_s3(bucket_name, file_key):
         print(f"An error occurred: {e}")
 
 
+def redshift_table_exists(table_name):
+    """True if the table exists in Redshift's public schema."""
+    exists_query = f"""
+    SELECT EXISTS (
+        SELECT 1
+        FROM information_schema.tables
+        WHERE table_schema = 'public' AND table_name = '{table_name}'
+    );
+    """
+    # Always live: the answer changes as tables are created and swapped, so never serve it from the result cache
+    result = query_redshift(exists_query, False, cache=False)
+    return bool(result.iloc[0, 0])
+
+
 def redshift_table_management(table_name, staging_table_query, logger):
     """
     Checks if a table exists in Redshift. If it exists, the function does nothing.
     If it does not exist, it creates the table using the provided query and populates it from S3.
     """
     try:
-        # Check if the table exists
-        exists_query = f"""
-        SELECT EXISTS (
-            SELECT 1
-            FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_name = '{table_name}'
-        );
-        """
-        result = query_redshift(exists_query, False)  # Assuming this returns a DataFrame or similar
-        
         # If the table exists, drop it
-        if result.iloc[0][0]:  # Access the first row, first column for the EXISTS result
+        if redshift_table_exists(table_name):
         
             drop_query = f"""
             DROP TABLE datahouse.public.{table_name}"""
@@ -128,6 +787,72 @@ def redshift_table_management(table_name, staging_table_query, logger):
         logger.error(f"Error managing table '{table_name}': {e}")
 
 
+def retarget_statement(statement, table_name, new_table_name):
+    """Points a CREATE TABLE or COPY statement at new_table_name by replacing its first reference to table_name."""
+    retargeted, replaced = re.subn(rf"\b{re.escape(table_name)}\b", new_table_name, statement, count=1)
+    if not replaced:
+        raise ValueError(f"Table '{table_name}' not found in statement: {statement}")
+    return retargeted
 
 
-        
\ No newline at end of file
+def redshift_swap_load(table_name, staging_table_query, copy_query, logger):
+    """
+    Loads a table without the live copy ever being empty or partial.
+
+    The data is COPYed into a fresh {table_name}_staging table created from the
+    staging DDL, then swapped in with ALTER TABLE ... RENAME inside a single
+    transaction, so readers see either the old rows or the new ones. If the COPY
+    fails the live table is left untouched. Grants are not carried over by the
+    rename, so readers should be granted through ALTER DEFAULT PRIVILEGES, and
+    views on the table should be late-binding (WITH NO SCHEMA BINDING).
+    """
+    staging_name = f"{table_name}_staging"
+    previous_name = f"{table_name}_previous"
+
+    query_redshift(f"DROP TABLE IF EXISTS datahouse.public.{staging_name};", True)
+    query_redshift(retarget_statement(staging_table_query, table_name, staging_name), True)
+    logger.info(f"Created staging table {staging_name}")
+
+    query_redshift(retarget_statement(copy_query, table_name, staging_name), True)
+    logger.info(f"Loaded staging table {staging_name}")
+
+    # query_redshift runs the statements in one transaction and commits once, so the swap is atomic
+    swap_statements = [f"DROP TABLE IF EXISTS datahouse.public.{previous_name};"]
+    if redshift_table_exists(table_name):
+        swap_statements.append(f"ALTER TABLE datahouse.public.{table_name} RENAME TO {previous_name};")
+    swap_statements += [
+        f"ALTER TABLE datahouse.public.{staging_name} RENAME TO {table_name};",
+        f"DROP TABLE IF EXISTS datahouse.public.{previous_name};",
+    ]
+    query_redshift("\n".join(swap_statements), True)
+    logger.info(f"Swapped {staging_name} in as {table_name}")
+
+
+def redshift_watermarks(table_name, columns):
+    """Returns {column: MAX(column)} for the loaded table; columns with no values map to None."""
+    select_list = ", ".join(f"MAX({column}) AS {column}" for column in columns)
+    result = query_redshift(f"SELECT {select_list} FROM datahouse.public.{table_name};", False, cache=False)
+    return {column: (None if pd.isna(value) else value) for column, value in result.iloc[0].items()}
+
+
+def redshift_upsert(table_name, copy_query, key_column, logger):
+    """
+    Upserts the rows of a COPY source into a table on key_column.
+
+    The rows are COPYed into a {table_name}_delta table shaped LIKE the target,
+    matching target rows are deleted and the delta inserted. Everything runs in
+    one transaction, so readers never see the rows missing and a failure leaves
+    the table unchanged.
+    """
+    delta_name = f"{table_name}_delta"
+    statements = [
+        f"DROP TABLE IF EXISTS datahouse.public.{delta_name};",
+        f"CREATE TABLE datahouse.public.{delta_name} (LIKE datahouse.public.{table_name});",
+        f"{retarget_statement(copy_query, table_name, delta_name).rstrip().rstrip(';')};",
+        f"DELETE FROM datahouse.public.{table_name} USING datahouse.public.{delta_name} "
+        f"WHERE {table_name}.{key_column} = {delta_name}.{key_column};",
+        f"INSERT INTO datahouse.public.{table_name} SELECT * FROM datahouse.public.{delta_name};",
+        f"DROP TABLE datahouse.public.{delta_name};",
+    ]
+    query_redshift("\n".join(statements), True)
+    logger.info(f"Upserted new rows into {table_name} on {key_column}")
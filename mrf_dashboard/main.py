@@ -5,11 +5,16 @@ import csv
 import json
 
 from dotenv import load_dotenv
-from pathlib import Path
-from core.query_utils import collapse_vector, query_postgres, query_redshift
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from core.query_utils import collapse_vector, query_postgres, query_redshift, get_pool, iter_postgres_chunks, copy_postgres
 from core.excel_utils import special_write_function
-from export_s3 import write_to_s3, redshift_table_management, run_aws_sso_login
-from stats_835_837 import customer_store, customer_df_prep
+from export_s3 import redshift_table_management, redshift_table_exists, run_aws_sso_login, S3StreamWriter, stream_dataframes_to_s3
+from export_s3 import output_key, copy_with_compression, delete_stale_variants, ddl_arrow_schema, parquet_copy_query, ParquetStreamWriter
+from export_s3 import existing_upload, write_copy_manifest, manifest_copy_query, redshift_swap_load
+from export_s3 import repoint_copy_source, redshift_watermarks, redshift_upsert, read_json_from_s3, write_json_to_s3
+from stats_835_837 import customer_store, customer_df_prep, customer_df_prep_batch, customer_fingerprints, reference_fingerprint
+from reference_cache import reference_cache
 
 dotenv_path = "/Users/blayton/Documents/env/.env"
 load_dotenv(dotenv_path)
@@ -45,6 +50,186 @@ s3_bucket = data["s3_bucket"]
 parent_directory = data["parent_directory"]
 dashboard_components = data["dashboard_components"]
 dashboard_analysis = data["dashboard_analysis"]
+# Reload Redshift tables even when none of their S3 objects changed
+force_refresh = data.get("force_refresh", False)
+
+def loaded_marker_key(table_name):
+    """S3 key of the marker recording which objects were last loaded into table_name."""
+    return f"{parent_directory}/state/{table_name}.loaded.json"
+
+def load_signature(uploads):
+    """{s3_key: etag} of the objects a load reads."""
+    return {upload.s3_key: upload.etag for upload in uploads}
+
+def refresh_needed(table_name, uploads, logger):
+    """A table is only reloaded when the S3 objects it loads (UploadResults) differ from the ones last
+    loaded into it, as recorded by record_load, or when it does not exist yet. Comparing with the last
+    load rather than with the previous S3 contents means a load that failed after its upload is retried."""
+    if force_refresh:
+        logger.info(f"Refreshing {table_name} (force_refresh).")
+        return True
+    if not redshift_table_exists(table_name):
+        return True
+
+    loaded = (read_json_from_s3(s3_bucket, loaded_marker_key(table_name)) or {}).get("objects") or {}
+    current = load_signature(uploads)
+    if loaded != current:
+        changed_keys = sorted(s3_key for s3_key in set(loaded) | set(current) if loaded.get(s3_key) != current.get(s3_key))
+        logger.info(f"S3 objects differ from the last load of {table_name}: {changed_keys}")
+        return True
+
+    logger.info(f"{table_name} is already loaded from these S3 objects. Skipping table refresh.")
+    return False
+
+def record_load(table_name, uploads):
+    """Records the objects loaded into table_name. Only call once the COPY or swap has committed."""
+    write_json_to_s3(s3_bucket, loaded_marker_key(table_name), {"objects": load_signature(uploads)})
+
+def rename_customer_database(df, logger, warn=True):
+    """Strips the customer_ prefixes from customer_database and renames it to customer_name."""
+    if 'customer_database' in df.columns:
+        df['customer_database'] = (
+            df['customer_database']
+            .str.replace('^legacy_customer_', '', regex=True)
+            .str.replace('^customer_', '', regex=True)
+        )
+        df = df.rename(columns={'customer_database': 'customer_name'})
+    elif warn:
+        logger.warning(f"Column 'customer_database' not found in the result.")
+
+    return df
+
+def copy_statement(value, table_name, output_format, compression):
+    """The component's COPY statement, adjusted for its output format (Parquet) or compression (GZIP/ZSTD)."""
+    copy_query = value["copy_query"].format(table_name=table_name, role=redshift_role)
+    if output_format == "parquet":
+        return parquet_copy_query(copy_query)
+    return copy_with_compression(copy_query, compression)
+
+def export_schema(staging_table_query, output_format):
+    """Parquet files are typed from the staging DDL; CSV exports need no schema."""
+    return ddl_arrow_schema(staging_table_query) if output_format == "parquet" else None
+
+def export_writer(s3_path, output_format, compression, staging_table_query):
+    """S3 writer for a component's export: Parquet typed from the staging DDL, or (compressed) CSV."""
+    if output_format == "parquet":
+        return ParquetStreamWriter(s3_bucket, s3_path, export_schema(staging_table_query, output_format))
+    return S3StreamWriter(s3_bucket, s3_path, compression=compression)
+
+def extract_to_writer(writer, query, extract_mode, output_format, logger, params=None):
+    """Streams a claims query into an export writer. Returns the number of rows written."""
+    if extract_mode == "copy" and output_format == "csv":
+        # COPY streams the server's CSV bytes as is, so any column processing lives in the query
+        return copy_postgres(query, cred_prefix="CLAIMS", destination=writer, params=params)
+
+    row_count = 0
+    for chunk_number, df in enumerate(iter_postgres_chunks(query, cred_prefix="CLAIMS", params=params)):
+        writer.write_frame(rename_customer_database(df, logger, warn=chunk_number == 0))
+        row_count += len(df)
+    return row_count
+
+def incremental_state_key(table_name):
+    """S3 key of the state an incremental component checks before trusting its deltas."""
+    return f"{parent_directory}/state/{table_name}.incremental.json"
+
+def loaded_rows_fingerprint(value, incremental, watermarks):
+    """
+    Row count and order-independent hash of the source rows a load at these watermarks already covers
+    (every row the >= delta would not pick up again). Only the key and incremental["mutable_columns"]
+    are hashed, or the whole row when no mutable columns are configured.
+    """
+    mutable_columns = incremental.get("mutable_columns")
+    row_expression = f"ROW({', '.join([incremental['key_column']] + mutable_columns)})" if mutable_columns else "loaded"
+    predicates = " OR ".join(f"{column} >= %({column})s" for column in watermarks) or "FALSE"
+    fingerprint_query = (
+        f"SELECT COUNT(*) AS row_count, "
+        f"COALESCE(SUM(('x' || substr(md5(CAST({row_expression} AS text)), 1, 8))::bit(32)::int::bigint), 0) AS row_hash "
+        f"FROM ({value['query'].strip().rstrip(';')}) AS loaded WHERE NOT COALESCE(({predicates}), FALSE)"
+    )
+    df = query_postgres(fingerprint_query, False, cred_prefix="CLAIMS", params=watermarks, cache=False)
+    return f"{int(df.iloc[0, 0])}:{int(df.iloc[0, 1])}"
+
+def incremental_snapshot(value, incremental):
+    """
+    The source's current watermarks and the fingerprint of the rows below them. Taken before an extract,
+    so an in-place change racing the extract at worst triggers one extra full reload, never a missed one.
+    """
+    max_columns = ", ".join(f"MAX({column}) AS {column}" for column in incremental["watermark_columns"])
+    df = query_postgres(f"SELECT {max_columns} FROM ({value['query'].strip().rstrip(';')}) AS loaded", False, cred_prefix="CLAIMS", cache=False)
+    watermarks = {column: str(df.iloc[0][column]) for column in incremental["watermark_columns"] if pd.notna(df.iloc[0][column])}
+    return {"watermarks": watermarks, "fingerprint": loaded_rows_fingerprint(value, incremental, watermarks)}
+
+def incremental_refresh(value, incremental, logger):
+    """
+    Extracts only the rows at or past the loaded table's high-watermarks and upserts them on the key column.
+    The watermarks are the MAX of each watermark column already in Redshift. Rows below the watermarks
+    can still change in place (incremental["mutable_columns"], e.g. is_removed or error_message), which
+    a delta never sees, so their fingerprint is compared with the one stored at the last refresh and any
+    difference, or a last full load older than incremental["full_reload_days"], forces a full load.
+    Returns False when a full load is needed instead.
+    """
+    table_name = value["table_name"]
+    if not redshift_table_exists(table_name):
+        logger.info(f"Table {table_name} does not exist yet, running a full load.")
+        return False
+
+    state = read_json_from_s3(s3_bucket, incremental_state_key(table_name))
+    if not state:
+        logger.info(f"No incremental state for {table_name}, running a full load.")
+        return False
+
+    full_reload_days = incremental.get("full_reload_days")
+    if full_reload_days and datetime.now(timezone.utc) - datetime.fromisoformat(state["full_load_at"]) > timedelta(days=full_reload_days):
+        logger.info(f"Last full load of {table_name} was at {state['full_load_at']}, running a full load.")
+        return False
+
+    if loaded_rows_fingerprint(value, incremental, state["watermarks"]) != state["fingerprint"]:
+        logger.info(f"Rows already loaded into {table_name} changed in place, running a full load.")
+        return False
+
+    watermarks = {
+        column: watermark
+        for column, watermark in redshift_watermarks(table_name, incremental["watermark_columns"]).items()
+        if watermark is not None
+    }
+    if not watermarks:
+        logger.info(f"No watermark found in {table_name}, running a full load.")
+        return False
+
+    snapshot = incremental_snapshot(value, incremental)
+
+    # >= re-reads the rows at the watermark, which the upsert makes harmless, so none are missed
+    predicates = " OR ".join(f"{column} >= %({column})s" for column in watermarks)
+    delta_query = f"SELECT * FROM ({value['query'].strip().rstrip(';')}) AS delta WHERE {predicates}"
+    logger.info(f"Incremental extract for {table_name} from watermarks {watermarks}")
+
+    compression = value.get("compression")
+    output_format = value.get("output_format", "csv")
+    # Kept outside the component's prefix so a full load never picks the delta file up
+    s3_path = output_key(f"{parent_directory}/incremental/{value['subdirectory_name']}/{value['file_name']}", output_format, compression)
+    with export_writer(s3_path, output_format, compression, value.get("staging_table_query")) as writer:
+        row_count = extract_to_writer(writer, delta_query, value.get("extract_mode", "cursor"), output_format, logger, params=watermarks)
+
+    if not row_count:
+        logger.info(f"No new rows for {table_name}.")
+        return True
+
+    copy_query = repoint_copy_source(copy_statement(value, table_name, output_format, compression), f"s3://{s3_bucket}/{s3_path}")
+    redshift_upsert(table_name, copy_query, incremental["key_column"], logger)
+    # The table no longer matches the last full export, so a later full load must not be skipped
+    record_load(table_name, [])
+    write_json_to_s3(s3_bucket, incremental_state_key(table_name), {**snapshot, "full_load_at": state["full_load_at"]})
+    logger.info(f"Incremental refresh of {table_name} loaded {row_count} rows from {s3_path}")
+    return True
+
+def record_full_load(table_name, snapshot, logger):
+    """Stores the incremental state taken before a full load, once the table holds that load."""
+    if snapshot is None:
+        return
+    try:
+        write_json_to_s3(s3_bucket, incremental_state_key(table_name), {**snapshot, "full_load_at": datetime.now(timezone.utc).isoformat()})
+    except Exception as e:
+        logger.warning(f"Could not store incremental state for {table_name}, the next run will do a full load: {e}")
 
 ## query metadata, then upload csv to s3
 def global_components(dashboard_components, logger):
@@ -57,40 +242,55 @@ def global_components(dashboard_components, logger):
             query = value["query"]
             staging_table_query = value.get("staging_table_query", None)
             truncate_query = value.get("truncate_query").format(table_name=table_name)
+            extract_mode = value.get("extract_mode", "cursor")
+            load_mode = value.get("load_mode", "truncate")
+            compression = value.get("compression")
+            output_format = value.get("output_format", "csv")
+            incremental = value.get("incremental")
 
+            # Incremental components only move new rows; force_refresh (or any failure) falls back to a full load
+            if incremental and not force_refresh:
+                try:
+                    if incremental_refresh(value, incremental, logger):
+                        continue
+                except Exception as e:
+                    logger.error(f"Incremental refresh of {table_name} failed, running a full load: {e}")
+
+            # Taken before the export, so the next incremental run can tell whether loaded rows changed since
+            snapshot = None
+            if incremental:
+                try:
+                    snapshot = incremental_snapshot(value, incremental)
+                except Exception as e:
+                    logger.warning(f"Could not take incremental state for {table_name}, the next run will do a full load: {e}")
+
+            # Stream the query result to S3 as CSV or Parquet, it will overwrite the existing file
             try:
-                # Fetch data from PostgreSQL
-                df = query_postgres(query, False, cred_prefix="CLAIMS")
-
-                # Process the dataframe
-                if 'customer_database' in df.columns:
-                    df['customer_database'] = (
-                        df['customer_database']
-                        .str.replace('^legacy_customer_', '', regex=True)
-                        .str.replace('^customer_', '', regex=True)
-                    )
-                    df = df.rename(columns={'customer_database': 'customer_name'})
-                else:
-                    logger.warning(f"Column 'customer_database' not found in the result.")
+                s3_path = output_key(f"{parent_directory}/{subdirectory_name}/{file_name}", output_format, compression)
+                with export_writer(s3_path, output_format, compression, staging_table_query) as writer:
+                    extract_to_writer(writer, query, extract_mode, output_format, logger)
+                # The COPY reads the whole prefix, so drop copies written in another format or compression
+                delete_stale_variants(s3_bucket, [s3_path])
             except Exception as e:
-                logger.error(f"Error fetching or processing data for component '{key}': {e}")
+                logger.error(f"Error exporting {file_name} to S3 for component '{key}': {e}")
                 continue
 
-            # Save to a CSV file
-            try:
-                file_path = Path.cwd() / file_name
-                df.to_csv(file_path, index=False)
-            except Exception as e:
-                logger.error(f"Error saving file {file_name} for component '{key}': {e}")
+            if not refresh_needed(table_name, [writer.result], logger):
+                record_full_load(table_name, snapshot, logger)
                 continue
 
-            # Write the CSV to S3, it will overwrite the existing file
-            try:
-                s3_path = f"{parent_directory}/{subdirectory_name}/{file_name}"
-                write_to_s3(file_path, s3_bucket, s3_path)
-                os.remove(file_path)
-            except Exception as e:  
-                logger.error(f"Error uploading {file_name} to S3 for component '{key}': {e}")
+            # Swap mode loads a staging table and renames it in, so the live table is never empty
+            if load_mode == "swap":
+                try:
+                    copy_query = copy_statement(value, table_name, output_format, compression)
+                    redshift_swap_load(table_name, staging_table_query, copy_query, logger)
+                    record_load(table_name, [writer.result])
+                    logger.info(f"Refresh of {table_name} successful using new data from {s3_path}")
+                except Exception as e:
+                    logger.error(f"Error during refresh process for {table_name}: {str(e)}")
+                    logger.error(f"Failed to refresh table using new data from {s3_path}")
+                    raise
+                record_full_load(table_name, snapshot, logger)
                 continue
 
             ## check if tables exist in redshift. if it doesnt, create them. 
@@ -108,17 +308,70 @@ def global_components(dashboard_components, logger):
                 logger.info(f"Truncation successful for {table_name}")
 
                 # Copy new data
-                copy_query = value["copy_query"].format(table_name=table_name, role=redshift_role)
+                copy_query = copy_statement(value, table_name, output_format, compression)
                 query_redshift(copy_query, True)
+                record_load(table_name, [writer.result])
                 logger.info(f"Refresh of {table_name} successful using new data from {s3_path}")
 
             except Exception as e:
                 logger.error(f"Error during refresh process for {table_name}: {str(e)}")
                 logger.error(f"Failed to refresh table using new data from {s3_path}")
                 raise  # Re-raise the exception if you want calling code to handle it
-        
+
+            record_full_load(table_name, snapshot, logger)
+
+
+def customer_s3_key(s3_prefix, file_name, customer_schema, output_format, compression):
+    """S3 key of one customer's analysis file."""
+    return output_key(f"{s3_prefix}/{file_name.format(customer_schema=customer_schema)}", output_format, compression)
+
+def upload_customer_analysis(df, customer_schema, key, file_name, s3_prefix, s3_bucket, logger, compression=None, schema=None):
+    """Uploads one customer's analysis file. Returns the UploadResult, or None if there was nothing to upload.
+    Upload errors are raised so the caller can fall back to the customer's previous file."""
+    if df is None or df.empty:
+        logger.warning(f"No data for customer schema {customer_schema}. Skipping.")
+        logging.getLogger().handlers[0].flush() 
+        return None
+
+    # Write the CSV (or Parquet file when a schema is given) to S3 from memory
+    try:
+        output_format = "parquet" if schema is not None else "csv"
+        s3_path = customer_s3_key(s3_prefix, file_name, customer_schema, output_format, compression)
+        return stream_dataframes_to_s3([df], s3_bucket, s3_path, compression=compression, schema=schema)
+    except Exception as e:
+        logger.error(f"Error uploading {file_name} to S3 for component '{key}': {e}")
+        raise
+
+
+def customer_analysis(customer_schemas, key, file_name, s3_prefix, s3_bucket, logger, compression=None, schema=None):
+    """Builds and uploads the analysis files for a group of customer schemas. Groups of more than
+    one schema are extracted with a single batched query per claims type.
+    Returns (uploads, failed_customers); a customer with no claims is neither, while one whose
+    extraction or upload failed is listed in failed_customers."""
+    if len(customer_schemas) == 1:
+        frames = {customer_schemas[0]: customer_df_prep(customer_schemas[0], logger)}
+    else:
+        frames = customer_df_prep_batch(customer_schemas, logger)
+
+    uploads = []
+    failed_customers = []
+    for customer_schema, df in frames.items():
+        try:
+            if isinstance(df, Exception):
+                raise df
+            uploads.append(upload_customer_analysis(df, customer_schema, key, file_name, s3_prefix, s3_bucket, logger, compression, schema))
+        except Exception as e:
+            failed_customers.append(customer_schema)
+            logger.error(f"Error building {key} for customer schema {customer_schema}: {e}")
+
+    return [upload for upload in uploads if upload is not None], failed_customers
+
+
 ## deidenified 835_837 customer stats, functions are held in stats_835_837.py
 def analysis_compenents(dashboard_analysis, parent_directory, s3_bucket, redshift_role, logger): 
+    # Reference datasets are fetched once per run and shared by every customer
+    reference_cache.invalidate()
+
     for analysis in dashboard_analysis: 
         for key, value in analysis.items():
             try:
@@ -128,38 +381,123 @@ def analysis_compenents(dashboard_analysis, parent_directory, s3_bucket, redshif
                 table_name = value.get("table_name")
                 staging_table_query = value.get("staging_table_query")
                 truncate_query = value.get("truncate_query").format(table_name=table_name)
+                max_workers = int(value.get("max_workers", 1))
+                schema_batch_size = int(value.get("schema_batch_size", 1))
+                compression = value.get("compression")
+                output_format = value.get("output_format", "csv")
+                load_mode = value.get("load_mode", "truncate")
 
                 if not subdirectory_name or not file_name or not table_name:
                     logger.error(f"Missing required keys in analysis component '{key}'. Skipping.")
                     continue
 
+                s3_path = f"{parent_directory}/{subdirectory_name}"
+                schema = export_schema(staging_table_query, output_format)
                 customer_list = customer_store()
-                for customer_schema in customer_list:
-                    df = customer_df_prep(customer_schema, logger)
+                customer_keys = {
+                    customer_schema: customer_s3_key(s3_path, file_name, customer_schema, output_format, compression)
+                    for customer_schema in customer_list
+                }
 
-                    if df is None or df.empty:
-                        logger.warning(f"No data for customer schema {customer_schema}. Skipping.")
-                        logging.getLogger().handlers[0].flush() 
-                        continue
+                # Customers whose claims files and reference data are unchanged since the last run keep their file
+                state_key = f"{parent_directory}/state/{table_name}.fingerprints.json"
+                fingerprints = customer_fingerprints()
+                reference = reference_fingerprint()
+                full_recompute = force_refresh or value.get("full_recompute", False)
+                previous_state = {} if full_recompute else (read_json_from_s3(s3_bucket, state_key) or {})
+                previous_fingerprints = previous_state.get("customers", {}) if previous_state.get("reference") == reference else {}
 
-                    try:
-                        formatted_file_name = file_name.format(customer_schema=customer_schema)
-                        file_path = Path.cwd() / formatted_file_name
-                        df.to_csv(file_path, index=False)
-                    except Exception as e:
-                        logger.error(f"Error saving file {file_name} for component '{key}': {e}")
-                        continue
+                unchanged_customers = [
+                    customer_schema for customer_schema in customer_list
+                    if customer_schema in fingerprints and previous_fingerprints.get(customer_schema) == fingerprints[customer_schema]
+                ]
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    previous_uploads = dict(zip(
+                        unchanged_customers,
+                        executor.map(lambda customer_schema: existing_upload(s3_bucket, customer_keys[customer_schema]), unchanged_customers),
+                    ))
+                uploads = [upload for upload in previous_uploads.values() if upload is not None]
+                reused_customers = [customer_schema for customer_schema, upload in previous_uploads.items() if upload is not None]
+                pending_customers = [customer_schema for customer_schema in customer_list if customer_schema not in reused_customers]
+                logger.info(f"{len(reused_customers)} of {len(customer_list)} customers unchanged for '{key}', reusing their files. Recomputing {len(pending_customers)}.")
+
+                customer_groups = [
+                    pending_customers[index:index + schema_batch_size]
+                    for index in range(0, len(pending_customers), schema_batch_size)
+                ]
+
+                # Fan out over customer groups; one group's failure does not stop the others
+                failed_customers = []
+                # Each group holds two CLAIMS connections at once (its 835 and 837 queries), so more workers
+                # than the pool can serve would wait out the pool's acquire timeout and drop customers
+                analysis_workers = max(1, min(max_workers, get_pool("postgres", "CLAIMS").max_size // 2))
+                if analysis_workers < max_workers:
+                    logger.warning(f"max_workers {max_workers} for '{key}' capped at {analysis_workers} by the CLAIMS connection pool size.")
+                with ThreadPoolExecutor(max_workers=analysis_workers, thread_name_prefix=key) as executor:
+                    futures = {
+                        executor.submit(customer_analysis, customer_group, key, file_name, s3_path, s3_bucket, logger, compression, schema): customer_group
+                        for customer_group in customer_groups
+                    }
+                    for future in as_completed(futures):
+                        customer_group = futures[future]
+                        try:
+                            group_uploads, group_failures = future.result()
+                            uploads.extend(group_uploads)
+                            failed_customers.extend(group_failures)
+                        except Exception as e:
+                            failed_customers.extend(customer_group)
+                            logger.error(f"Error building {key} for customer schemas {customer_group}: {e}")
+
+                if failed_customers:
+                    logger.warning(f"{len(failed_customers)} of {len(customer_list)} customers failed for '{key}': {sorted(failed_customers)}")
+                    # Keep loading the previous run's file for a failed customer rather than dropping its rows
+                    for customer_schema in failed_customers:
+                        previous = existing_upload(s3_bucket, customer_keys[customer_schema])
+                        if previous is not None:
+                            uploads.append(previous)
+
+                # Copies written in another format or compression are no longer loaded, so clean them up
+                delete_stale_variants(s3_bucket, [upload.s3_key for upload in uploads])
 
-                    # Write the CSV to S3
+                if not uploads:
+                    logger.warning(f"No files were written for '{key}'. Skipping refresh of {table_name}.")
+                    continue
+
+                # The manifest lists exactly this run's objects, so the COPY never scans stale files under the prefix
+                manifest_key = f"{parent_directory}/manifests/{table_name}.manifest"
+                manifest = write_copy_manifest(s3_bucket, manifest_key, uploads)
+                loaded_objects = uploads + [manifest]
+
+                # Fingerprints behind every file written or reused, failed customers are retried next run.
+                # Stored only once the table holds these files, so a failed load never marks customers as done
+                written_keys = {upload.s3_key for upload in uploads} - {customer_keys[customer_schema] for customer_schema in failed_customers}
+                customer_state = {
+                    "reference": reference,
+                    "customers": {
+                        customer_schema: fingerprints[customer_schema]
+                        for customer_schema in customer_list
+                        if customer_schema in fingerprints and customer_keys[customer_schema] in written_keys
+                    },
+                }
+
+                if not refresh_needed(table_name, loaded_objects, logger):
+                    # The table was already loaded from exactly these objects
+                    write_json_to_s3(s3_bucket, state_key, customer_state)
+                    continue
+
+                # Swap mode loads a staging table and renames it in, so the live table is never empty
+                if load_mode == "swap":
                     try:
-                        s3_path = f"{parent_directory}/{subdirectory_name}/{formatted_file_name}"
-                        write_to_s3(file_path, s3_bucket, s3_path)
+                        copy_query = manifest_copy_query(copy_statement(value, table_name, output_format, compression), s3_bucket, manifest_key)
+                        redshift_swap_load(table_name, staging_table_query, copy_query, logger)
+                        record_load(table_name, loaded_objects)
+                        write_json_to_s3(s3_bucket, state_key, customer_state)
+                        logger.info(f"Refresh of {table_name} successful using {len(uploads)} files listed in {manifest_key}")
                     except Exception as e:
-                        logger.info(f"Error uploading {file_name} to S3 for component '{key}': {e}")
-                    finally:
-                        if file_path.exists():
-                            os.remove(file_path)
-                            continue
+                        logger.error(f"Error during refresh process for {table_name}: {str(e)}")
+                        logger.error(f"Failed to refresh table using new data from {s3_path}")
+                        raise
+                    continue
 
                 # Check if table exists in Redshift
                 try: 
@@ -174,9 +512,11 @@ def analysis_compenents(dashboard_analysis, parent_directory, s3_bucket, redshif
                     logger.info(f"Truncation successful for {table_name}")
 
                     # Copy new data
-                    copy_query = value["copy_query"].format(table_name=table_name, role=redshift_role)
+                    copy_query = manifest_copy_query(copy_statement(value, table_name, output_format, compression), s3_bucket, manifest_key)
                     query_redshift(copy_query, True)
-                    logger.info(f"Refresh of {table_name} successful using new data from {s3_path}")
+                    record_load(table_name, loaded_objects)
+                    write_json_to_s3(s3_bucket, state_key, customer_state)
+                    logger.info(f"Refresh of {table_name} successful using {len(uploads)} files listed in {manifest_key}")
 
                 except Exception as e:
                     logger.error(f"Error during refresh process for {table_name}: {str(e)}")
@@ -0,0 +1,62 @@
+import logging
+import threading
+
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+
+class RunCache:
+    """
+    Run-scoped cache for reference datasets (org lists, provider lookups, ...).
+
+    Each key is loaded at most once per run, even when several worker threads
+    ask for it at the same time; the other threads wait for the first load.
+    Cached values are shared, so callers should treat them as read-only.
+    Call invalidate() to force a reload of one key or of everything.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key, loader):
+        """Return the cached value for key, calling loader() to build it on first use."""
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+
+        with self._key_lock(key):
+            # Another thread may have finished loading while we waited for the key lock
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+
+            start_time = perf_counter()
+            value = loader()
+            logger.info(f"Loaded reference data '{key}' in {perf_counter() - start_time:.2f} seconds")
+
+            with self._lock:
+                self._values[key] = value
+            return value
+
+    def invalidate(self, key=None):
+        """Drop one cached key, or every key when key is None."""
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+
+# Shared cache for the dashboard pipeline, cleared at the start of each run
+reference_cache = RunCache()
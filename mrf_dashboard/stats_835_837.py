@@ -3,10 +3,13 @@ import os
 import logging
 import csv
 import json
+import hashlib
 
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 from core.query_utils import collapse_vector, query_postgres, query_redshift
 from core.excel_utils import special_write_function
+from reference_cache import reference_cache
 
 dotenv_path = "/Users/blayton/Documents/env/.env"
 load_dotenv(dotenv_path)
@@ -35,6 +38,8 @@ stats_835_837 = data["dashboard_analysis"][0]["stats_835_837"]
 
 products_org_id_query = stats_835_837["products_org_id_query"]
 contract_model_query = stats_835_837["contract_model_query"]
+# Statement timeout for one schema's 835 or 837 query; batched queries get this per schema in the batch
+query_timeout_seconds = float(stats_835_837.get("query_timeout_seconds", 600))
 
 
 def customer_store() -> list:
@@ -49,6 +54,27 @@ def customer_store() -> list:
 
     return customer_list
 
+def customer_fingerprints() -> dict:
+    """Per-schema fingerprint of the claims files ingested so far (file counts and latest created/parsed
+    times from management_customer_files). A schema's stats can only change when its fingerprint does."""
+    # Change detection must see the live table, never a cached result
+    df = query_postgres(stats_835_837["fingerprint_query"], False, cred_prefix="CLAIMS", cache=False)
+
+    return {
+        row.customer_database: f"{row.file_count}|{row.removed_count}|{row.last_created_at}|{row.last_parsed_at}"
+        for row in df.itertuples(index=False)
+    }
+
+def reference_fingerprint() -> str:
+    """Hash of the inputs shared by every schema: the valid customer providers and the claims queries.
+    Row order is ignored, so the hash only moves when the data does."""
+    row_hashes = pd.util.hash_pandas_object(valid_customers_to_compare(), index=False).sort_values()
+
+    digest = hashlib.sha256(row_hashes.to_numpy().tobytes())
+    digest.update(stats_835_837["query_835"].encode("utf-8"))
+    digest.update(stats_835_837["query_837"].encode("utf-8"))
+    return digest.hexdigest()
+
 def data_frame_prep(valid_customers_df, claims_835_df, claims_837_df):
     processed_835_df = pd.merge(valid_customers_df, claims_835_df, left_on="npi", right_on="npi_835")
     processed_837_df = pd.merge(valid_customers_df, claims_837_df, left_on="npi", right_on="npi_837")
@@ -67,6 +93,10 @@ def process_df(df, customer_schema, query):
     return df
 
 def valid_customers_to_compare():
+    """Valid customer providers for the run. Fetched from Redshift once and then served from reference_cache."""
+    return reference_cache.get("valid_customers", load_valid_customers)
+
+def load_valid_customers():
     ## Pulling out the orgs from tq_organization_products
     orgs_df = query_redshift(products_org_id_query,False)
     #print(orgs_df)
@@ -81,64 +111,111 @@ def valid_customers_to_compare():
 
     return valid_customers_df
 
+def run_claims_queries(queries, timeout=None) -> list:
+    """Runs claims queries concurrently on the pooled CLAIMS connections and returns their results in order.
+    timeout defaults to query_timeout_seconds. A failed query leaves its exception in its slot
+    instead of raising, so the other results are kept."""
+    def run(query):
+        try:
+            return query_postgres(query, False, cred_prefix="CLAIMS", timeout=timeout or query_timeout_seconds)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(len(queries), 1), thread_name_prefix="claims") as executor:
+        return list(executor.map(run, queries))
+
 def claims_extract(customer_schema, logger) -> pd.DataFrame :
     """Taps into query_store(), pulls out query to use for each customer_schema in customer_list
-    Returns both an 835 and 837 dataframe containing info for each customer"""
+    Returns both an 835 and 837 dataframe containing info for each customer. A customer with no
+    claims gets empty dataframes; a query that fails raises, so it is never mistaken for no data."""
 
     claims_835_df = pd.DataFrame()
     claims_837_df = pd.DataFrame()
 
         # Get customer claims stats
-    try:
-        query_835_template = stats_835_837["query_835"]
-        if query_835_template:
-            query_835 = query_835_template.format(customer_schema=customer_schema)
-            if not query_835:
-                logger.info(f"No 835 query made for {customer_schema}.")
-        elif not query_835_template:
-            logger.error("No 835 query found in JSON.")
-        
-        query_837_template = stats_835_837["query_837"]
-        if query_837_template:
-            query_837 = query_837_template.format(customer_schema=customer_schema)
-            if not query_837:
-                logger.info(f"No 837 query made for {customer_schema}.")
-        elif not query_837_template:
-            logger.error("No 837 query found in JSON.")
-
-        if query_835:
-            try:
-                claims_835_df = query_postgres(query_835,False, cred_prefix="CLAIMS")
-                if claims_835_df is not None and not claims_835_df.empty:
-                    claims_835_df = process_df(claims_835_df, customer_schema, query_835)
-                else:
-                    logger.info(f"No data returned for {customer_schema}, {query_835}.")
-
-
-            except Exception as e:
-                logger.error(f"Error in the querying of database: {e}")
-        
-        if query_837:
-            try:
-                claims_837_df = query_postgres(query_837, False, cred_prefix="CLAIMS")
-                if claims_837_df is not None and not claims_837_df.empty:
-                    claims_837_df = process_df(claims_837_df, customer_schema, query_837)
-                else:
-                    logger.info(f"No data returned for {customer_schema}, {query_837}.")
-
-            except Exception as e:
-                logger.error(f"Error in the querying of database: {e}")
-        
-    except Exception as e:
-        logger.error(f"Error in building {customer_schema}'s queries.")
+    query_835_template = stats_835_837.get("query_835")
+    query_837_template = stats_835_837.get("query_837")
+    if not query_835_template or not query_837_template:
+        raise RuntimeError("No 835 or 837 query found in JSON.")
+
+    query_835 = query_835_template.format(customer_schema=customer_schema)
+    query_837 = query_837_template.format(customer_schema=customer_schema)
+
+    # Run the 835 and 837 queries concurrently, then report every failure together
+    results = run_claims_queries([query_835, query_837])
+
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        logger.error(f"Error in the querying of database for {customer_schema}: {failed[0]}")
+        raise RuntimeError(f"Claims queries failed for {customer_schema}: {failed[0]}") from failed[0]
+
+    for name, query, result in zip(("835", "837"), (query_835, query_837), results):
+        if result is not None and not result.empty:
+            result = process_df(result, customer_schema, query)
+            if name == "835":
+                claims_835_df = result
+            else:
+                claims_837_df = result
+        else:
+            logger.info(f"No data returned for {customer_schema}, {query}.")
 
     return claims_835_df, claims_837_df
 
             
-def customer_df_prep(customer_schema, logger):
-    valid_customers_df = valid_customers_to_compare()
-    claims_835_df, claims_837_df = claims_extract(customer_schema, logger)
-    
+def batch_claims_query(query_template, customer_schemas) -> str:
+    """Renders a per-schema claims query for every schema in the group and combines them with UNION ALL.
+    Each query already selects its schema as customer_name, so the rows can be split back per customer."""
+    queries = [
+        f"SELECT * FROM ({query_template.format(customer_schema=customer_schema).strip().rstrip(';')}) AS claims_{index}"
+        for index, customer_schema in enumerate(customer_schemas)
+    ]
+    return "\nUNION ALL\n".join(queries)
+
+def split_by_customer(df, customer_schemas, query) -> dict:
+    """Splits a batched result on customer_name into one processed dataframe per schema."""
+    frames = {customer_schema: pd.DataFrame() for customer_schema in customer_schemas}
+    if df is None or df.empty:
+        return frames
+
+    for customer_schema, customer_df in df.groupby('customer_name', sort=False):
+        frames[customer_schema] = process_df(customer_df.reset_index(drop=True), customer_schema, query)
+
+    return frames
+
+def claims_extract_or_error(customer_schema, logger):
+    """claims_extract, returning the exception instead of raising so one schema does not fail its whole group."""
+    try:
+        return claims_extract(customer_schema, logger)
+    except Exception as e:
+        return e
+
+def claims_extract_batch(customer_schemas, logger) -> dict:
+    """Runs the 835 and 837 queries for a group of schemas as one UNION ALL query each.
+    Returns {customer_schema: (claims_835_df, claims_837_df)}. If a batched query fails
+    (e.g. one schema is missing a table) the group falls back to per-schema claims_extract,
+    and a schema whose own queries fail gets its exception in place of the dataframes."""
+    if len(customer_schemas) == 1:
+        return {customer_schemas[0]: claims_extract_or_error(customer_schemas[0], logger)}
+
+    query_835 = batch_claims_query(stats_835_837["query_835"], customer_schemas)
+    query_837 = batch_claims_query(stats_835_837["query_837"], customer_schemas)
+    # A UNION ALL over the group does the work of len(customer_schemas) single-schema queries
+    results = run_claims_queries([query_835, query_837], timeout=query_timeout_seconds * len(customer_schemas))
+
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        logger.warning(f"Batched claims query failed for {customer_schemas}, falling back to per-schema queries: {failed[0]}")
+        return {customer_schema: claims_extract_or_error(customer_schema, logger) for customer_schema in customer_schemas}
+
+    claims_835_frames = split_by_customer(results[0], customer_schemas, query_835)
+    claims_837_frames = split_by_customer(results[1], customer_schemas, query_837)
+
+    return {
+        customer_schema: (claims_835_frames[customer_schema], claims_837_frames[customer_schema])
+        for customer_schema in customer_schemas
+    }
+
+def combine_claims(valid_customers_df, claims_835_df, claims_837_df, logger):
     if not claims_837_df.empty and not claims_835_df.empty:
         final_processed_df = data_frame_prep(valid_customers_df, claims_835_df, claims_837_df)
         return final_processed_df
@@ -146,7 +223,19 @@ def customer_df_prep(customer_schema, logger):
         logger.info("Customer does not have claims dataframes to process.")
         return pd.DataFrame()  # Return empty DataFrame instead of undefined variable
 
+def customer_df_prep(customer_schema, logger):
+    valid_customers_df = valid_customers_to_compare()
+    claims_835_df, claims_837_df = claims_extract(customer_schema, logger)
 
+    return combine_claims(valid_customers_df, claims_835_df, claims_837_df, logger)
 
+def customer_df_prep_batch(customer_schemas, logger) -> dict:
+    """customer_df_prep for a group of schemas, extracting all of their claims stats in one round trip per query.
+    A schema whose claims could not be extracted maps to the exception instead of a dataframe."""
+    valid_customers_df = valid_customers_to_compare()
+    claims = claims_extract_batch(customer_schemas, logger)
 
-
+    return {
+        customer_schema: extracted if isinstance(extracted, Exception) else combine_claims(valid_customers_df, *extracted, logger)
+        for customer_schema, extracted in claims.items()
+    }